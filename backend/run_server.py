@@ -1,4 +1,10 @@
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run("src.api.server:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "src.api.server:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=True,
+        ws="src.api.ws_protocol:WebSocketProtocol",
+    )
@@ -1,7 +1,20 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
+from typing import Iterator
 import difflib
+import os
+
+# Optional C-accelerated matcher; falls back to pure-Python difflib
+try:
+    from cdifflib import CSequenceMatcher as _SequenceMatcher
+except ImportError:
+    _SequenceMatcher = difflib.SequenceMatcher
+
+# Upper bound on threads used to write files in apply_all
+MAX_APPLY_WORKERS = 32
 
 
 class ChangeType(Enum):
@@ -10,99 +23,278 @@ class ChangeType(Enum):
     DELETE = "delete"
 
 
+# Past-tense labels used in the apply_all report
+_APPLIED_LABELS = {
+    ChangeType.CREATE: "Created",
+    ChangeType.MODIFY: "Modified",
+    ChangeType.DELETE: "Deleted",
+}
+
+
 @dataclass
 class StagedChange:
     path: str
     change_type: ChangeType
     new_content: str
     original_content: str | None = None
+    original_bytes: bytes | None = None  # Raw on-disk content, decoded on demand
+    diff: str | None = None  # Cached unified diff, filled on first get_diff()
+    
+    def load_original_content(self) -> str | None:
+        """Return the original content as text, decoding it on first use.
+        
+        stage_write keeps the raw bytes and stage_delete doesn't read the
+        file at all, since the text is only needed when a diff or preview
+        is actually rendered.
+        """
+        if self.original_content is None:
+            raw = self.original_bytes
+            if raw is None and self.change_type is ChangeType.DELETE:
+                try:
+                    raw = Path(self.path).read_bytes()
+                except FileNotFoundError:
+                    return None
+            if raw is not None:
+                self.original_content = raw.decode("utf-8", errors="replace")
+        return self.original_content
+
+
+def _format_range(start: int, stop: int) -> str:
+    """Format a hunk range the same way difflib.unified_diff does."""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _unified(old_lines: list[str], new_lines: list[str], fromfile: str, tofile: str, n: int = 3):
+    """Yield unified diff lines in the same format as difflib.unified_diff(..., lineterm="").
+
+    The common prefix/suffix is trimmed before matching (keeping n lines of
+    context) so only the changed region goes through the sequence matcher.
+    """
+    if old_lines == new_lines:
+        return
+
+    prefix = 0
+    limit = min(len(old_lines), len(new_lines))
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+
+    # Offset of the trimmed slices within the original line lists
+    start = max(0, prefix - n)
+    trim = max(0, suffix - n)
+    old_lines = old_lines[start:len(old_lines) - trim]
+    new_lines = new_lines[start:len(new_lines) - trim]
+
+    yield f"--- {fromfile}"
+    yield f"+++ {tofile}"
+    for group in _SequenceMatcher(None, old_lines, new_lines).get_grouped_opcodes(n):
+        first, last = group[0], group[-1]
+        old_range = _format_range(start + first[1], start + last[2])
+        new_range = _format_range(start + first[3], start + last[4])
+        yield f"@@ -{old_range} +{new_range} @@"
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in old_lines[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in old_lines[i1:i2]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in new_lines[j1:j2]:
+                    yield "+" + line
+
+
+def _compute_diff(change: StagedChange) -> str:
+    """Return the unified diff text for a single staged change."""
+    if change.change_type is ChangeType.CREATE:
+        # New file - show all lines as additions
+        new_lines = change.new_content.splitlines()
+        diff = _unified([], new_lines, "/dev/null", change.path)
+    elif change.change_type is ChangeType.DELETE:
+        # Deleted file - show all lines as removals
+        old_lines = (change.load_original_content() or "").splitlines()
+        diff = _unified(old_lines, [], change.path, "/dev/null")
+    else:
+        # Modified file
+        original_content = change.load_original_content() or ""
+        if original_content == change.new_content:
+            return ""
+        old_lines = original_content.splitlines()
+        new_lines = change.new_content.splitlines()
+        diff = _unified(old_lines, new_lines, f"a/{change.path}", f"b/{change.path}")
+    
+    return "\n".join(diff)
+
+
+def _write_file(file_path: Path, content: str) -> None:
+    """Atomically replace file_path with content.
+    
+    Data goes to a sibling temp file with raw os.write calls (bypassing
+    Python's 8 KiB buffer) and is then renamed over the target, so a crash
+    never leaves a half-written file. An existing file's mode is preserved.
+    Symlinks are followed, so the link stays and its target is replaced.
+    """
+    file_path = Path(os.path.realpath(file_path))
+    tmp_path = file_path.with_name(file_path.name + ".koda.tmp")
+    data = memoryview(content.encode("utf-8"))
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        try:
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+            try:
+                os.fchmod(fd, os.stat(file_path).st_mode & 0o7777)
+            except FileNotFoundError:
+                pass
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 
 class ChangeManager:
     def __init__(self):
-        self._staged: list[StagedChange] = []
+        # Keyed by path; dicts keep insertion order so changes apply in staging order
+        self._staged: dict[str, StagedChange] = {}
+        # path -> (mtime_ns, size, raw bytes) of the last read of that file
+        self._read_cache: dict[str, tuple[int, int, bytes]] = {}
+    
+    def _read_with_cache(self, path: str) -> bytes:
+        """Read a file, reusing the last read if its mtime and size are unchanged.
+        
+        Raises FileNotFoundError if the file does not exist.
+        """
+        st = os.stat(path)
+        cached = self._read_cache.get(path)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        
+        content = Path(path).read_bytes()
+        self._read_cache[path] = (st.st_mtime_ns, st.st_size, content)
+        return content
     
     def stage_write(self, path: str, content: str) -> str:
         """Stage a file write. Don't actually write yet."""
-        file_path = Path(path)
-        
-        # Check if file exists to determine CREATE vs MODIFY
-        if file_path.exists():
-            original_content = file_path.read_text()
+        # Read directly to determine CREATE vs MODIFY
+        try:
+            original_bytes = self._read_with_cache(path)
             change_type = ChangeType.MODIFY
-        else:
-            original_content = None
+        except FileNotFoundError:
+            original_bytes = None
             change_type = ChangeType.CREATE
         
         # Check if we already have a staged change for this path
-        for i, change in enumerate(self._staged):
-            if change.path == path:
-                # Update existing staged change
-                self._staged[i] = StagedChange(
-                    path=path,
-                    change_type=change_type,
-                    new_content=content,
-                    original_content=change.original_content  # Keep original
-                )
-                return f"[STAGED] Updated staged changes for '{path}'"
+        existing = self._staged.get(path)
+        
+        # Compare against the content captured when the path was first staged
+        baseline = original_bytes
+        if existing is not None and existing.original_bytes is not None:
+            baseline = existing.original_bytes
+        
+        # Writing back the original content is a no-op; drop any earlier edit
+        if change_type is ChangeType.MODIFY and content.encode("utf-8") == baseline:
+            self._staged.pop(path, None)
+            return f"[STAGED] No changes for '{path}' (content unchanged)"
+        
+        if existing is not None:
+            # Update existing staged change
+            self._staged[path] = StagedChange(
+                path=path,
+                change_type=change_type,
+                new_content=content,
+                original_bytes=baseline  # Keep original
+            )
+            return f"[STAGED] Updated staged changes for '{path}'"
         
         # Store the new change
-        self._staged.append(StagedChange(
+        self._staged[path] = StagedChange(
             path=path,
             change_type=change_type,
             new_content=content,
-            original_content=original_content
-        ))
+            original_bytes=original_bytes
+        )
         
-        action = "create" if change_type == ChangeType.CREATE else "modify"
+        action = "create" if change_type is ChangeType.CREATE else "modify"
         return f"[STAGED] Will {action} '{path}' (not yet applied)"
     
     def stage_delete(self, path: str) -> str:
         """Stage a file deletion. Don't actually delete yet."""
-        file_path = Path(path)
-        
-        if not file_path.exists():
+        if not os.path.exists(path):
             return f"Error: File '{path}' does not exist"
         
-        original_content = file_path.read_text()
-        
-        self._staged.append(StagedChange(
+        # Reuse content captured by an earlier stage_write; otherwise it is
+        # loaded lazily by StagedChange.load_original_content()
+        existing = self._staged.get(path)
+        self._staged[path] = StagedChange(
             path=path,
             change_type=ChangeType.DELETE,
             new_content="",
-            original_content=original_content
-        ))
+            original_bytes=existing.original_bytes if existing else None
+        )
         
         return f"[STAGED] Will delete '{path}' (not yet applied)"
     
     def get_staged_changes(self) -> list[StagedChange]:
         """Return all staged changes."""
-        return self._staged.copy()
+        return list(self._staged.values())
+    
+    def get_staged_change(self, path: str) -> StagedChange | None:
+        """Return the staged change for a path, if any."""
+        return self._staged.get(path)
     
     def apply_all(self) -> str:
         """Apply all staged changes to disk."""
         if not self._staged:
             return "No changes to apply."
         
-        applied = []
-        for change in self._staged:
-            file_path = Path(change.path)
-            
-            if change.change_type == ChangeType.DELETE:
-                file_path.unlink()
-                applied.append(f"Deleted: {change.path}")
-            else:
-                # CREATE or MODIFY
-                file_path.parent.mkdir(parents=True, exist_ok=True)
-                file_path.write_text(change.new_content)
-                action = "Created" if change.change_type == ChangeType.CREATE else "Modified"
-                applied.append(f"{action}: {change.path}")
+        # Create each distinct parent directory once, shallowest first
+        parents = {
+            Path(change.path).parent
+            for change in self._staged.values()
+            if change.change_type is not ChangeType.DELETE
+        }
+        for parent in sorted(parents, key=lambda p: len(p.parts)):
+            parent.mkdir(parents=True, exist_ok=True)
+        
+        # Paths are unique, so writes are independent; the GIL is released
+        # during the syscalls. map() re-raises the first error and keeps order.
+        changes = list(self._staged.values())
+        with ThreadPoolExecutor(max_workers=min(MAX_APPLY_WORKERS, len(changes))) as executor:
+            applied = list(executor.map(self._apply_one, changes))
+        
+        for change in changes:
+            self._read_cache.pop(change.path, None)
         
         count = len(self._staged)
         self._staged.clear()
         
         return f"Applied {count} change(s):\n" + "\n".join(applied)
     
+    def _apply_one(self, change: StagedChange) -> str:
+        """Apply a single staged change to disk and describe it."""
+        file_path = Path(change.path)
+        
+        if change.change_type is ChangeType.DELETE:
+            file_path.unlink()
+        else:
+            # CREATE or MODIFY
+            _write_file(file_path, change.new_content)
+        return f"{_APPLIED_LABELS[change.change_type]}: {change.path}"
+    
     def discard_all(self) -> str:
         """Discard all staged changes."""
         count = len(self._staged)
@@ -113,53 +305,32 @@ class ChangeManager:
         """Return a unified diff of all changes."""
         if not self._staged:
             return "No staged changes."
+        return "".join(self.iter_diffs())
+    
+    def iter_diffs(self) -> Iterator[str]:
+        """Yield the unified diff one file at a time.
         
-        diffs = []
-        for change in self._staged:
-            if change.change_type == ChangeType.CREATE:
-                # New file - show all lines as additions
-                new_lines = change.new_content.splitlines(keepends=True)
-                diff = difflib.unified_diff(
-                    [],
-                    new_lines,
-                    fromfile=f"/dev/null",
-                    tofile=change.path,
-                    lineterm=""
-                )
-            elif change.change_type == ChangeType.DELETE:
-                # Deleted file - show all lines as removals
-                old_lines = (change.original_content or "").splitlines(keepends=True)
-                diff = difflib.unified_diff(
-                    old_lines,
-                    [],
-                    fromfile=change.path,
-                    tofile="/dev/null",
-                    lineterm=""
-                )
-            else:
-                # Modified file
-                old_lines = (change.original_content or "").splitlines(keepends=True)
-                new_lines = change.new_content.splitlines(keepends=True)
-                diff = difflib.unified_diff(
-                    old_lines,
-                    new_lines,
-                    fromfile=f"a/{change.path}",
-                    tofile=f"b/{change.path}",
-                    lineterm=""
-                )
-            
-            diffs.append("".join(diff))
-        
-        return "\n".join(diffs)
+        Joined together the chunks form get_diff()'s output, so a large
+        patch can be streamed without building it in memory.
+        """
+        first = True
+        for change in list(self._staged.values()):
+            # Re-staging replaces the StagedChange, so a cached diff is never stale
+            if change.diff is None:
+                change.diff = _compute_diff(change)
+            if change.diff:
+                yield change.diff if first else "\n" + change.diff
+                first = False
     
     def summary(self) -> str:
         """Return a brief summary of staged changes."""
         if not self._staged:
             return "No staged changes."
         
-        creates = sum(1 for c in self._staged if c.change_type == ChangeType.CREATE)
-        modifies = sum(1 for c in self._staged if c.change_type == ChangeType.MODIFY)
-        deletes = sum(1 for c in self._staged if c.change_type == ChangeType.DELETE)
+        counts = Counter(c.change_type for c in self._staged.values())
+        creates = counts[ChangeType.CREATE]
+        modifies = counts[ChangeType.MODIFY]
+        deletes = counts[ChangeType.DELETE]
         
         parts = []
         if creates:
@@ -1,15 +1,145 @@
-import json
+import asyncio
+import re
+import reprlib
 from typing import Any
-from .state import AgentState, Phase
+from .state import AgentState, Phase, PHASE_VALUES
 from .change_manager import ChangeManager
-from ..llm import chat, chat_with_tools
-from .tool_executor import execute_tool
-from ..tools.registry import get_tool_schemas
-from ..tools.file_ops import set_change_manager
+from ..llm import achat_with_tools, astream_chat
+from .tool_executor import aexecute_tool, ToolResultCache
+from ..tools.registry import get_tool_schemas, SERIAL_TOOLS
+from ..tools.file_ops import set_change_manager, prefetch_files
 from ..cli.theme import console, spinner, print_summary
 from ..cli.diff_display import display_staged_changes
 from ..db.token_tracker import TokenTracker, TokenLimitExceeded
-from ..utils.repo_cache import get_cached_summary, save_summary
+from ..utils.repo_cache import get_or_compute_summary
+from ..utils import json_compat, speculative_cache
+
+# Number of previous step results included in each execute prompt
+MAX_CONTEXT_STEPS = 8
+
+# Tool results are compacted once the ones carried in a tool loop exceed
+# this many characters (~20k tokens at ~4 chars/token)...
+COMPACT_AFTER_CHARS = 80_000
+# ...keeping the results of the most recent turns verbatim
+KEEP_RECENT_TOOL_TURNS = 2
+# Older results keep this much of their head and tail
+_TRUNCATE_HEAD = 500
+_TRUNCATE_TAIL = 200
+_TRUNCATE_MARKER = "\n... [truncated] ...\n"
+
+# Bounded repr for tool-call previews: stops formatting large values (e.g. the
+# content argument of write_file) instead of building the full string first
+_preview_repr = reprlib.Repr()
+_preview_repr.maxstring = 60
+_preview_repr.maxother = 60
+_preview_repr.maxdict = 3
+
+# Optional lenient parser used to recover malformed plans
+try:
+    import json5
+except ImportError:
+    json5 = None
+
+# Body of a response wrapped in a markdown code block (``` or ```json), so
+# unwrapping is one anchored match. Greedy, so the scan backtracks from the end
+# to the closing fence.
+_FENCE_RE = re.compile(r"\A\s*```[^\n]*\n(.*)```\s*\Z", re.DOTALL)
+# Outermost JSON array in a response with stray text around it
+_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([\]}])")
+
+
+def _parse_plan_json(response: str) -> list:
+    """Parse the planner's JSON array, tolerating common LLM formatting slips.
+    
+    Falls back to extracting the outermost [...] and parsing it leniently
+    (json5 if installed, otherwise with trailing commas removed) so a
+    slightly malformed plan doesn't abort the whole run.
+    """
+    match = _FENCE_RE.match(response)
+    json_str = (match.group(1) if match else response).strip()
+    # Complete JSON ends in ] or }; skip the strict parse when it can't succeed
+    if json_str[-1:] in ("]", "}"):
+        try:
+            return json_compat.loads(json_str)
+        except json_compat.JSONDecodeError:
+            pass
+    array_match = _ARRAY_RE.search(json_str)
+    if not array_match:
+        raise ValueError("incomplete plan: no JSON array found")
+    candidate = array_match.group(0)
+    if json5 is not None:
+        return json5.loads(candidate)
+    return json_compat.loads(_TRAILING_COMMA_RE.sub(r"\1", candidate))
+
+
+
+def _compact_messages(messages: list, keep_recent: int = KEEP_RECENT_TOOL_TURNS) -> int:
+    """Truncate tool results older than the last keep_recent turns, in place.
+    
+    Returns the number of tool-result characters left in messages.
+    """
+    turns = [m for m in messages if m["role"] == "user" and isinstance(m["content"], list)]
+    stale = len(turns) - keep_recent
+    limit = _TRUNCATE_HEAD + _TRUNCATE_TAIL + len(_TRUNCATE_MARKER)
+    total = 0
+    for i, message in enumerate(turns):
+        for block in message["content"]:
+            content = block["content"]
+            if i < stale and len(content) > limit:
+                content = block["content"] = content[:_TRUNCATE_HEAD] + _TRUNCATE_MARKER + content[-_TRUNCATE_TAIL:]
+            total += len(content)
+    return total
+
+class _PlanStreamParser:
+    """Incrementally extract step objects from a streamed JSON array.
+    
+    Scans each delta once, tracking string/escape state and brace depth, and
+    parses an element as soon as its closing brace arrives at array depth 1.
+    Anything before the opening [ (e.g. a code fence) is skipped.
+    """
+    
+    def __init__(self):
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current: list[str] = []
+    
+    def feed(self, delta: str) -> list[dict]:
+        """Consume a chunk of the response and return the newly completed steps."""
+        steps = []
+        for ch in delta:
+            if self._done:
+                break
+            if not self._started:
+                self._started = ch == "["
+                continue
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._current = [ch]
+                elif ch == "]":
+                    self._done = True
+                continue
+            self._current.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{" or ch == "[":
+                self._depth += 1
+            elif ch == "}" or ch == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    steps.append(json_compat.loads("".join(self._current)))
+        return steps
 
 
 class Agent:
@@ -32,6 +162,10 @@ class Agent:
         self._user_id = user_id  # For token tracking
         self._task_description = task_description
         self._repo_path = repo_path  # Path to cloned repository
+        # Read-only tool results reused within a run (created by run())
+        self._tool_cache: ToolResultCache | None = None
+        # Serializes SERIAL_TOOLS across plan steps that run concurrently
+        self._serial_tool_lock = asyncio.Lock()
         
         # Set up token tracking for all users
         # Free tier users have limit enforcement; API key users track without limits
@@ -39,7 +173,7 @@ class Agent:
         self._on_usage = None
         if user_id:
             self._token_tracker = TokenTracker(user_id, check_limit=not api_key)
-            self._on_usage = lambda input_t, output_t: self._token_tracker.record_usage(
+            self._on_usage = lambda input_t, output_t: self._token_tracker.record_usage_buffered(
                 input_t, output_t, self._task_description
             )
 
@@ -47,12 +181,70 @@ class Agent:
     def change_manager(self) -> ChangeManager | None:
         return self._change_manager
 
-    def _emit(self, event: str, data: Any):
-        """Emit an event to registered callbacks."""
-        if event in self._callbacks:
-            self._callbacks[event](data)
+    def _emit(self, event: str, *args: Any):
+        """Emit an event to registered callbacks.
+        
+        Callbacks get the event's data as one argument, except tool_call
+        (name, args) and tool_result (name, result).
+        """
+        callback = self._callbacks.get(event)
+        if callback is not None:
+            callback(*args)
 
-    def _execute_with_tools(self, prompt: str, readonly: bool = False, show_tools: bool = True, phase: str = "executing") -> str:
+    async def _run_tool(self, block, show_tools: bool) -> str:
+        """Execute a single tool_use block off the event loop, emitting progress events."""
+        tool_name = block.name
+        tool_args = block.input
+        
+        # Emit tool_call event
+        self._emit("tool_call", tool_name, tool_args)
+        
+        if show_tools:
+            args_str = _preview_repr.repr(tool_args)
+            if len(args_str) > 60:
+                args_str = args_str[:60] + "..."
+            console.print(f"  [tool]→[/tool] [muted]{tool_name}[/muted]([path]{args_str}[/path])")
+        
+        result = await aexecute_tool(tool_name, tool_args, self._tool_cache)
+        
+        # Emit tool_result event
+        self._emit("tool_result", tool_name, result)
+        
+        if show_tools:
+            result_preview = result[:80] + "..." if len(result) > 80 else result
+            result_preview = result_preview.replace("\n", " ")
+            console.print(f"  [success]←[/success] [muted]{result_preview}[/muted]")
+        
+        return result
+
+    async def _run_tools(self, tool_blocks: list, show_tools: bool) -> list[str]:
+        """Run a turn's tool calls, returning results in tool_use order.
+        
+        Consecutive independent calls (reads, searches) run concurrently.
+        SERIAL_TOOLS act as barriers: everything requested before them
+        finishes first and they run alone, so a read issued after a write
+        in the same turn still sees the write.
+        """
+        results: list[str] = []
+        batch: list = []
+        
+        async def flush_batch():
+            if batch:
+                results.extend(await asyncio.gather(*(self._run_tool(b, show_tools) for b in batch)))
+                batch.clear()
+        
+        for block in tool_blocks:
+            if block.name in SERIAL_TOOLS:
+                await flush_batch()
+                async with self._serial_tool_lock:
+                    results.append(await self._run_tool(block, show_tools))
+            else:
+                batch.append(block)
+        await flush_batch()
+        
+        return results
+
+    async def _execute_with_tools(self, prompt: str, readonly: bool = False, show_tools: bool = True, phase: str = "executing") -> str:
         """Execute a prompt with tool support, handling tool calls in a loop.
         
         Args:
@@ -63,13 +255,16 @@ class Agent:
         """
         messages = [{"role": "user", "content": prompt}]
         tools = get_tool_schemas(readonly=readonly)
+        # Characters of tool output carried in messages (see _compact_messages)
+        result_chars = 0
         
-        # In headless mode, never show tools
-        if self._headless:
+        # In headless mode, never show tools; without a terminal attached
+        # (e.g. redirected output) skip building previews nobody sees
+        if self._headless or not console.is_terminal:
             show_tools = False
         
         while True:
-            response = chat_with_tools(messages, tools, api_key=self._api_key, on_usage=self._on_usage, phase=phase, provider=self._provider)
+            response = await achat_with_tools(messages, tools, api_key=self._api_key, on_usage=self._on_usage, phase=phase, provider=self._provider)
             
             if response.stop_reason == "end_turn":
                 # Extract final text response
@@ -82,85 +277,76 @@ class Agent:
                 # Add assistant's response to messages
                 messages.append({"role": "assistant", "content": response.content})
                 
-                # Process each tool call
-                tool_results = []
-                for block in response.content:
-                    if block.type == "tool_use":
-                        tool_name = block.name
-                        tool_args = block.input
-                        
-                        # Emit tool_call event
-                        self._emit("tool_call", {"name": tool_name, "args": tool_args})
-                        
-                        if show_tools:
-                            args_str = str(tool_args)
-                            if len(args_str) > 60:
-                                args_str = args_str[:60] + "..."
-                            console.print(f"  [tool]→[/tool] [muted]{tool_name}[/muted]([path]{args_str}[/path])")
-                        
-                        result = execute_tool(tool_name, tool_args)
-                        
-                        # Emit tool_result event
-                        self._emit("tool_result", {"name": tool_name, "result": result})
-                        
-                        if show_tools:
-                            result_preview = result[:80] + "..." if len(result) > 80 else result
-                            result_preview = result_preview.replace("\n", " ")
-                            console.print(f"  [success]←[/success] [muted]{result_preview}[/muted]")
-                        
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": result
-                        })
+                tool_blocks = [block for block in response.content if block.type == "tool_use"]
+                
+                results = await self._run_tools(tool_blocks, show_tools)
+                
+                tool_results = [
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": block.id,
+                        "content": result
+                    }
+                    for block, result in zip(tool_blocks, results)
+                ]
                 
                 # Add tool results to messages
                 messages.append({"role": "user", "content": tool_results})
+                
+                # Keep long tool loops from resending every old file read in full
+                result_chars += sum(len(result) for result in results)
+                if result_chars > COMPACT_AFTER_CHARS:
+                    result_chars = _compact_messages(messages)
             
             else:
                 # Unexpected stop reason
                 return f"Unexpected stop reason: {response.stop_reason}"
     
     def run(self, task: str) -> None:
+        """Run a task to completion from synchronous code (the CLI)."""
+        asyncio.run(self.arun(task))
+    
+    async def arun(self, task: str) -> None:
+        """Run a task on the caller's event loop.
+        
+        LLM calls are awaited and blocking tool I/O goes to worker threads,
+        so the loop keeps serving other work while the agent runs.
+        """
         # Create change manager for staging file writes
         self._change_manager = ChangeManager()
+        self._tool_cache = ToolResultCache()
         
         try:
-            self._run_task(task)
+            await self._run_task(task)
         except TokenLimitExceeded as e:
             # Token limit exceeded during execution
             self._state.phase = Phase.ERROR
             self._state.error = str(e)
-            self._emit("phase_change", self._state.phase.value)
+            self._emit("phase_change", PHASE_VALUES[self._state.phase])
             self._emit("error", str(e))
             if not self._headless:
                 console.print(f"\n[error]✗ {str(e)}[/error]")
             # Disable change staging
             set_change_manager(None)
             return
+        finally:
+            # Write any usage still buffered, including on error paths
+            if self._token_tracker:
+                await asyncio.to_thread(self._token_tracker.flush)
     
-    def _run_task(self, task: str) -> None:
-        """Internal method that runs the task (can raise TokenLimitExceeded)."""
-        # === UNDERSTANDING PHASE ===
-        self._state.phase = Phase.UNDERSTANDING
-        self._state.task = task
-        self._emit("phase_change", self._state.phase.value)
-        
-        if not self._headless:
-            console.print(f"\n[heading]Understanding task:[/heading] {task}\n")
-        
-        # Check for cached summary (token optimization)
-        cached_summary = None
-        if self._repo_path:
-            cached_summary = get_cached_summary(self._repo_path)
+    async def _explore(self, task: str | None) -> str:
+        """Explore the codebase with read-only tools and return a summary.
         
-        if cached_summary:
-            summary = cached_summary
-            if not self._headless:
-                console.print("[muted]Using cached codebase summary[/muted]")
-                console.print(f"\n[heading]Codebase Summary:[/heading]")
-                console.print(f"[muted]{summary}[/muted]\n")
-            self._emit("cache_hit", True)
+        Without a task the summary is a general one, safe to cache and share
+        between runs (and users) working on the same repo content.
+        """
+        if task is None:
+            understanding_prompt = """Explore the codebase to understand its structure.
+Use list_directory and read_file to understand what exists.
+Do NOT create or modify any files - just observe.
+Then summarize what you found: the project's purpose, layout, main
+components and where key functionality lives, so the summary is useful
+for any later task."""
         else:
             understanding_prompt = f"""The user wants to: {task}
 
@@ -168,79 +354,108 @@ Explore the codebase to understand its structure.
 Use list_directory and read_file to understand what exists.
 Do NOT create or modify any files - just observe.
 Then summarize what you found."""
-            
-            # Use Haiku for understanding phase (cheaper, faster)
-            if self._headless:
-                summary = self._execute_with_tools(understanding_prompt, readonly=True, show_tools=False, phase="understanding")
-            else:
-                with spinner("Exploring codebase..."):
-                    summary = self._execute_with_tools(understanding_prompt, readonly=True, show_tools=False, phase="understanding")
-                console.print(f"\n[heading]Codebase Summary:[/heading]")
-                console.print(f"[muted]{summary}[/muted]\n")
-            
-            # Cache the summary for future tasks
-            if self._repo_path:
-                save_summary(self._repo_path, summary)
         
-        # Emit summary event
-        self._emit("summary", summary)
+        # Use Haiku for understanding phase (cheaper, faster)
+        if self._headless:
+            return await self._execute_with_tools(understanding_prompt, readonly=True, show_tools=False, phase="understanding")
+        with spinner("Exploring codebase..."):
+            return await self._execute_with_tools(understanding_prompt, readonly=True, show_tools=False, phase="understanding")
+    
+    async def _understand(self, task: str) -> str:
+        """Run the understanding phase and return the codebase summary."""
+        if not self._repo_path:
+            summary = await self._explore(task)
+        else:
+            # Cached or shared with a concurrent run on the same repo content
+            # (token optimization), so explored without this run's task
+            summary, cached = await get_or_compute_summary(self._repo_path, lambda: self._explore(None))
+            self._emit("cache_hit", cached)
+            if cached and not self._headless:
+                console.print("[muted]Using cached codebase summary[/muted]")
         
-        # === PLANNING PHASE ===
-        self._state.phase = Phase.PLANNING
-        self._emit("phase_change", self._state.phase.value)
+        if not self._headless:
+            console.print(f"\n[heading]Codebase Summary:[/heading]")
+            console.print(f"[muted]{summary}[/muted]\n")
         
-        planning_prompt = f"""Based on what you learned about the codebase, create a plan to: {task}
-
-Return your plan as a JSON array of steps. Each step should be an object with:
-- "description": what to do
-- "tool": which tool to use (read_file, write_file, list_directory, or null if no tool needed)
-
-Example:
-[
-  {{"description": "Create hello.txt with greeting", "tool": "write_file"}},
-  {{"description": "Verify file was created", "tool": "read_file"}}
-]
-
-Return ONLY valid JSON, no markdown, no explanation."""
+        return summary
+    
+    def _queue_step(self, step: dict, steps: asyncio.Queue) -> None:
+        """Record a parsed plan step and hand it to the executor.
         
-        # Use Sonnet for planning (smarter model)
-        if self._headless:
-            response = chat(planning_prompt, api_key=self._api_key, on_usage=self._on_usage, phase="planning", provider=self._provider)
+        Queues (number, description, depends_on). Steps without a depends_on
+        list depend on the previous step, so plans without it run in order.
+        """
+        desc, tool = step["description"], step.get("tool")
+        self._state.plan.append((desc, tool))
+        # The whole plan so far; the WebSocket callback keeps only the newest
+        # queued one, so a client that falls behind skips the intermediate ones
+        self._emit("plan", [{"description": d, "tool": t} for d, t in self._state.plan])
+        
+        i = len(self._state.plan)
+        if not self._headless:
+            # Printed above the planning spinner as each step streams in
+            if i == 1:
+                console.print(f"\n[heading]Plan:[/heading]")
+            tool_info = f" [muted][{tool}][/muted]" if tool else ""
+            console.print(f"  [accent]{i}.[/accent] {desc}{tool_info}")
+        
+        depends_on = step.get("depends_on")
+        if isinstance(depends_on, list):
+            # Only earlier steps can be waited on
+            depends_on = [d for d in depends_on if isinstance(d, int) and 1 <= d < i]
         else:
-            with spinner("Generating plan..."):
-                response = chat(planning_prompt, api_key=self._api_key, on_usage=self._on_usage, phase="planning", provider=self._provider)
+            depends_on = [i - 1] if i > 1 else []
+        steps.put_nowait((i, desc, depends_on))
+
+    async def _stream_plan(self, planning_prompt: str, steps: asyncio.Queue) -> None:
+        """Stream the planning response, queueing each step once its JSON object is complete.
         
-        # Parse JSON response
+        Puts None on the queue when planning ends. If incremental parsing fails,
+        the full response is parsed once and any steps not yet queued are added.
+        """
+        self._state.plan = []
+        parser: _PlanStreamParser | None = _PlanStreamParser()
+        chunks: list[str] = []
         try:
-            json_str = response.strip()
-            if json_str.startswith("```"):
-                json_str = json_str.split("\n", 1)[1]
-            if json_str.endswith("```"):
-                json_str = json_str.rsplit("```", 1)[0]
-            json_str = json_str.strip()
+            async for delta in astream_chat(planning_prompt, api_key=self._api_key, on_usage=self._on_usage, phase="planning", provider=self._provider):
+                chunks.append(delta)
+                if parser is None:
+                    continue
+                try:
+                    for step in parser.feed(delta):
+                        self._queue_step(step, steps)
+                except (ValueError, KeyError):
+                    parser = None
             
-            steps = json.loads(json_str)
-            self._state.plan = [{"description": step["description"], "tool": step.get("tool")} for step in steps]
-        except (json.JSONDecodeError, KeyError) as e:
-            if not self._headless:
-                console.print(f"[error]✗[/error] Failed to parse plan as JSON: {e}")
-                console.print(f"[muted]Raw response: {response[:200]}...[/muted]")
-            self._state.plan = []
-            self._state.error = f"Failed to parse plan: {e}"
-            return
+            if parser is None or not self._state.plan:
+                response = "".join(chunks)
+                try:
+                    for step in _parse_plan_json(response)[len(self._state.plan):]:
+                        self._queue_step(step, steps)
+                except (ValueError, KeyError) as e:
+                    # ValueError covers json/orjson decode errors and json5 failures
+                    if not self._state.plan:
+                        if not self._headless:
+                            console.print(f"[error]✗[/error] Failed to parse plan as JSON: {e}")
+                            console.print(f"[muted]Raw response: {response[:200]}...[/muted]")
+                        self._state.error = f"Failed to parse plan: {e}"
+        finally:
+            steps.put_nowait(None)
+
+    async def _execute_steps(self, steps: asyncio.Queue) -> None:
+        """Execute plan steps as they arrive, until the planner queues None.
         
-        # Emit plan event
-        self._emit("plan", self._state.plan)
+        Each step starts as soon as the steps it depends on have finished, so
+        independent steps run concurrently. The CLI runs steps in order to
+        keep its output readable.
+        """
+        step = await steps.get()
+        if step is None:
+            return
         
-        if not self._headless:
-            console.print(f"\n[heading]Plan:[/heading]")
-            for i, step in enumerate(steps, 1):
-                tool_info = f" [muted][{step.get('tool', 'none')}][/muted]" if step.get('tool') else ""
-                console.print(f"  [accent]{i}.[/accent] {step['description']}{tool_info}")
-
         # === EXECUTING PHASE ===
         self._state.phase = Phase.EXECUTING
-        self._emit("phase_change", self._state.phase.value)
+        self._emit("phase_change", PHASE_VALUES[self._state.phase])
         
         if not self._headless:
             console.print(f"\n[heading]Executing plan...[/heading]\n")
@@ -248,50 +463,151 @@ Return ONLY valid JSON, no markdown, no explanation."""
         # Enable change staging for file writes
         set_change_manager(self._change_manager)
         
-        execution_context = []
+        tasks: dict[int, asyncio.Task] = {}
+        # Context line for each finished step ("Step i: desc → result")
+        outputs: dict[int, str] = {}
+        # Most recent transitive dependencies of each step; only these are
+        # carried into its execute prompt
+        lineage: dict[int, list[int]] = {}
         
-        for i, step in enumerate(steps, 1):
-            desc = step["description"]
-            
-            # Emit step_start event
-            self._emit("step_start", {"step": i, "description": desc})
-            
-            if not self._headless:
-                console.print(f"[heading]━━━ Step {i}: {desc} ━━━[/heading]")
-            
-            context_str = "\n".join(execution_context) if execution_context else "None yet"
+        try:
+            while step is not None:
+                i, desc, depends_on = step
+                if not self._headless:
+                    depends_on = [i - 1] if i > 1 else []
+                ancestors = set(depends_on).union(*(lineage[d] for d in depends_on))
+                lineage[i] = sorted(ancestors)[-MAX_CONTEXT_STEPS:]
+                tasks[i] = asyncio.create_task(
+                    self._execute_step(i, desc, [tasks[d] for d in depends_on], lineage[i], outputs)
+                )
+                step = await steps.get()
             
-            execute_prompt = f"""Execute this step: {desc}
+            await asyncio.gather(*tasks.values())
+        finally:
+            # Stop the remaining steps if one of them failed
+            for task in tasks.values():
+                task.cancel()
+        
+        # Disable change staging
+        set_change_manager(None)
+
+    async def _execute_step(
+        self,
+        i: int,
+        desc: str,
+        wait_for: list[asyncio.Task],
+        context_steps: list[int],
+        outputs: dict[int, str],
+    ) -> None:
+        """Execute one plan step once the steps it depends on have finished."""
+        for task in wait_for:
+            await task
+        
+        # Emit step_start event
+        self._emit("step_start", {"step": i, "description": desc})
+        
+        if not self._headless:
+            console.print(f"[heading]━━━ Step {i}: {desc} ━━━[/heading]")
+        
+        context_str = "\n".join(outputs[j] for j in context_steps) if context_steps else "None yet"
+        
+        execute_prompt = f"""Execute this step: {desc}
 
 Previous steps completed:
 {context_str}
 
 Use the appropriate tool to complete this step. Be precise and only do what's asked."""
-            
-            result = self._execute_with_tools(execute_prompt, readonly=False, show_tools=not self._headless)
-            
-            # Emit step_complete event
-            self._emit("step_complete", {"step": i, "description": desc, "result": result})
-            
-            if not self._headless:
-                console.print(f"[success]✓[/success] {result}\n")
-            
-            execution_context.append(f"Step {i}: {desc} → {result[:200]}")
         
-        # Disable change staging
-        set_change_manager(None)
+        result = await self._execute_with_tools(execute_prompt, readonly=False, show_tools=not self._headless)
+        
+        # Emit step_complete event
+        self._emit("step_complete", {"step": i, "description": desc, "result": result})
+        
+        if not self._headless:
+            console.print(f"[success]✓[/success] {result}\n")
+        
+        outputs[i] = f"Step {i}: {desc} → {result[:200]}"
+
+    async def _run_task(self, task: str) -> None:
+        """Internal method that runs the task (can raise TokenLimitExceeded)."""
+        # === UNDERSTANDING PHASE ===
+        self._state.phase = Phase.UNDERSTANDING
+        self._state.task = task
+        self._emit("phase_change", PHASE_VALUES[self._state.phase])
+        
+        if not self._headless:
+            console.print(f"\n[heading]Understanding task:[/heading] {task}\n")
+        
+        # Explore the codebase while listing the repo root for the planning
+        # prompt, so planning can start as soon as the summary is ready
+        summary, repo_listing = await asyncio.gather(
+            self._understand(task),
+            aexecute_tool("list_directory", {"path": "."}, self._tool_cache),
+        )
+        
+        # Emit summary event
+        self._emit("summary", summary)
+        
+        # === PLANNING PHASE ===
+        self._state.phase = Phase.PLANNING
+        self._emit("phase_change", PHASE_VALUES[self._state.phase])
+        
+        planning_prompt = f"""Based on what you learned about the codebase, create a plan to: {task}
+
+Top-level files in the repository:
+{repo_listing}
+
+Return your plan as a JSON array of steps. Each step should be an object with:
+- "description": what to do
+- "tool": which tool to use (read_file, write_file, list_directory, or null if no tool needed)
+- "depends_on": numbers (starting at 1) of earlier steps that must finish first; [] if the step is independent and can run in parallel
+
+Example:
+[
+  {{"description": "Create hello.txt with greeting", "tool": "write_file", "depends_on": []}},
+  {{"description": "Create bye.txt with farewell", "tool": "write_file", "depends_on": []}},
+  {{"description": "Verify hello.txt was created", "tool": "read_file", "depends_on": [1]}}
+]
+
+Return ONLY valid JSON, no markdown, no explanation."""
+        
+        # Speculatively read files the summary mentions while the plan is generated
+        prefetch = asyncio.create_task(
+            asyncio.to_thread(prefetch_files, speculative_cache.extract_paths(summary))
+        )
+        
+        # Use Sonnet for planning (smarter model). Steps are queued as soon as
+        # they're parsed; headless runs start executing while the plan streams.
+        steps: asyncio.Queue = asyncio.Queue()
+        planner = None
+        if self._headless:
+            planner = asyncio.create_task(self._stream_plan(planning_prompt, steps))
+        else:
+            with spinner("Generating plan..."):
+                await self._stream_plan(planning_prompt, steps)
+        
+        try:
+            await self._execute_steps(steps)
+        finally:
+            if planner is not None and not planner.done():
+                planner.cancel()
+        if planner is not None:
+            await planner
+        await prefetch
+        if self._state.error:
+            return
 
         # === APPROVAL PHASE ===
         staged = self._change_manager.get_staged_changes()
         if not staged:
             self._state.phase = Phase.COMPLETE
-            self._emit("phase_change", self._state.phase.value)
+            self._emit("phase_change", PHASE_VALUES[self._state.phase])
             if not self._headless:
                 print_summary(changes_applied=0)
             return
         
         self._state.phase = Phase.AWAITING_APPROVAL
-        self._emit("phase_change", self._state.phase.value)
+        self._emit("phase_change", PHASE_VALUES[self._state.phase])
         
         # In headless mode, stop here and let caller handle approval
         if self._headless:
@@ -300,24 +616,34 @@ Use the appropriate tool to complete this step. Be precise and only do what's as
         # CLI mode: display diff and prompt for approval
         display_staged_changes(staged, self._change_manager.get_diff())
         
-        # Prompt user for approval
+        # Write buffered token usage while the user reviews the diff
+        flush = None
+        if self._token_tracker:
+            flush = asyncio.create_task(asyncio.to_thread(self._token_tracker.flush))
+        
+        # Prompt user for approval (in a thread, so the event loop keeps running)
         num_changes = len(staged)
         while True:
-            answer = console.input("\n[accent]Apply these changes?[/accent] [muted][y/n]:[/muted] ").strip().lower()
-            if answer in ("y", "yes"):
-                self._change_manager.apply_all()
-                self._state.phase = Phase.COMPLETE
-                self._emit("phase_change", self._state.phase.value)
-                print_summary(changes_applied=num_changes)
-                return
-            elif answer in ("n", "no"):
-                self._change_manager.discard_all()
-                self._state.phase = Phase.COMPLETE
-                self._emit("phase_change", self._state.phase.value)
-                print_summary(changes_applied=0, changes_rejected=num_changes)
-                return
-            else:
-                console.print("[warning]Please enter 'y' or 'n'.[/warning]")
+            answer = (await asyncio.to_thread(
+                console.input, "\n[accent]Apply these changes?[/accent] [muted][y/n]:[/muted] "
+            )).strip().lower()
+            if answer in ("y", "yes", "n", "no"):
+                break
+            console.print("[warning]Please enter 'y' or 'n'.[/warning]")
+        
+        if flush is not None:
+            await flush
+        
+        if answer in ("y", "yes"):
+            self._change_manager.apply_all()
+            self._state.phase = Phase.COMPLETE
+            self._emit("phase_change", PHASE_VALUES[self._state.phase])
+            print_summary(changes_applied=num_changes)
+        else:
+            self._change_manager.discard_all()
+            self._state.phase = Phase.COMPLETE
+            self._emit("phase_change", PHASE_VALUES[self._state.phase])
+            print_summary(changes_applied=0, changes_rejected=num_changes)
     
     def get_state(self) -> AgentState:
         return self._state
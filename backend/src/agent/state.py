@@ -11,9 +11,12 @@ class Phase(Enum):
     COMPLETE = "complete"
     ERROR = "error"
 
+# Wire value of each phase, looked up once instead of via .value on every emit
+PHASE_VALUES: dict[Phase, str] = {p: p.value for p in Phase}
+
 @dataclass
 class AgentState:
     phase: Phase
     task: Optional[str] = None
-    plan: Optional[list[str]] = None
+    plan: Optional[list[tuple[str, Optional[str]]]] = None  # (description, tool) per step
     error: Optional[str] = None
\ No newline at end of file
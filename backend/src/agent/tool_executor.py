@@ -1,14 +1,85 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable
 from ..tools.registry import TOOLS
 
+# Read-only tools whose results can be reused within a run. Any other tool
+# (writes, deletes, shell commands) may change what these return.
+CACHEABLE_TOOLS = frozenset({"read_file", "list_directory", "search_code", "index_symbols", "find_symbol"})
+MAX_CACHED_RESULTS = 256
 
-def execute_tool(name: str, inputs: dict) -> str:
-    """Execute a tool by name with given inputs. Return result as string."""
-    if name not in TOOLS:
+
+class ToolResultCache:
+    """Per-run LRU of read-only tool results, cleared whenever another tool runs."""
+
+    def __init__(self, maxsize: int = MAX_CACHED_RESULTS):
+        self._maxsize = maxsize
+        self._results: OrderedDict[tuple[str, str], str] = OrderedDict()
+        # Bumped on every invalidation so results computed before a write aren't stored after it
+        self.generation = 0
+        self._lock = threading.Lock()  # Tools run in worker threads
+
+    def get(self, key: tuple[str, str]) -> str | None:
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def put(self, key: tuple[str, str], result: str, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._results[key] = result
+            self._results.move_to_end(key)
+            if len(self._results) > self._maxsize:
+                self._results.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._results.clear()
+            self.generation += 1
+
+
+def execute_tool(name: str, inputs: dict, cache: ToolResultCache | None = None) -> str:
+    """Execute a tool by name with given inputs. Return result as string.
+
+    If a cache is given, read-only results are reused for identical inputs
+    and any other tool invalidates it.
+    """
+    tool_fn = TOOLS.get(name)
+    if tool_fn is None:
         return f"Error: Unknown tool '{name}'"
-    
+
+    if cache is None:
+        return _run_tool(name, tool_fn, inputs)
+
+    if name not in CACHEABLE_TOOLS:
+        try:
+            return _run_tool(name, tool_fn, inputs)
+        finally:
+            cache.invalidate()
+
+    key = (name, json.dumps(inputs, sort_keys=True, default=str))
+    result = cache.get(key)
+    if result is None:
+        generation = cache.generation
+        result = _run_tool(name, tool_fn, inputs)
+        # Errors (e.g. a file that doesn't exist yet) aren't worth remembering
+        if not result.startswith("Error"):
+            cache.put(key, result, generation)
+    return result
+
+
+def _run_tool(name: str, tool_fn: Callable[..., str], inputs: dict) -> str:
     try:
-        tool_fn = TOOLS[name]
-        result = tool_fn(**inputs)
-        return result
+        return tool_fn(**inputs)
     except Exception as e:
-        return f"Error executing {name}: {str(e)}"
\ No newline at end of file
+        return f"Error executing {name}: {e}"
+
+
+async def aexecute_tool(name: str, inputs: dict, cache: ToolResultCache | None = None) -> str:
+    """Run execute_tool in a worker thread so blocking tool I/O can overlap."""
+    return await asyncio.to_thread(execute_tool, name, inputs, cache)
@@ -1,100 +1,295 @@
 import os
+import asyncio
+import hashlib
+import secrets
+import threading
+import time
 import httpx
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+from urllib.parse import quote
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import RedirectResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+from pydantic import BaseModel, EmailStr
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, defer
+import jwt
+from jwt.utils import base64url_decode
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 import bcrypt
 
 from ..db.database import get_db
-from ..db.models import User, UserSession
+from ..db.models import User, UserSession, normalize_email
 from ..db.schemas import UserResponse, Token
+from ..utils.encryption import encrypt, decrypt
+from ..utils import token_revocation
+from ..utils.json_compat import loads as json_loads
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 # Security scheme
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Config
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_DAYS = 7
 
+# One PyJWT instance and pre-encoded key, reused for every encode/decode
+_jwt = jwt.PyJWT()
+_jwt_key = JWT_SECRET.encode()
+_JWT_DECODE_OPTIONS = {"require": ["exp", "sub"]}
+
+# Encoded JWT header segments already checked to declare our algorithm.
+# Every token we issue shares one header, so this stays tiny.
+_accepted_jwt_headers: set[str] = set()
+MAX_ACCEPTED_JWT_HEADERS = 8
+
+# Verified tokens: blake2b digest of the token -> (user_id, exp, jti, iat).
+# Keyed by digest so raw tokens aren't kept in memory.
+TOKEN_CACHE_SIZE = 4096
+_token_cache: OrderedDict[bytes, tuple[int, float, Optional[str], Optional[float]]] = OrderedDict()
+_token_cache_lock = threading.Lock()  # Sync dependencies run in FastAPI's threadpool
+
+# Shared client for OAuth calls, so repeat logins reuse pooled keep-alive
+# connections to GitHub/Google instead of a new TCP+TLS handshake per request
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    timeout=10.0,
+)
+
+async def close_http_client() -> None:
+    """Close the shared OAuth HTTP client (called on app shutdown)."""
+    await http_client.aclose()
+
 GITHUB_CLIENT_ID = os.getenv("GITHUB_CLIENT_ID")
 GITHUB_CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/api/auth/google/callback")
+
+FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
+
+# OAuth authorize URLs only depend on the config above, so build them once
+GITHUB_AUTH_URL = (
+    f"https://github.com/login/oauth/authorize"
+    f"?client_id={GITHUB_CLIENT_ID}"
+    f"&scope=user:email,repo"
+)
+GOOGLE_AUTH_URL = (
+    f"https://accounts.google.com/o/oauth2/v2/auth"
+    f"?client_id={GOOGLE_CLIENT_ID}"
+    f"&redirect_uri={quote(GOOGLE_REDIRECT_URI, safe='')}"
+    f"&response_type=code"
+    f"&scope=email%20profile"
+    f"&access_type=offline"
+)
+
+# Password hashing (Argon2id). Hashes from before the switch are bcrypt
+# ($2a$/$2b$/$2y$); they still verify and are upgraded on the next login.
+# Cost parameters can be tuned per deployment; existing hashes made with
+# other parameters are rehashed on the next login.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+password_hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+)
+
+# bcrypt only ever used the first 72 bytes; newer bcrypt releases raise
+# instead of truncating, so legacy checks truncate explicitly
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+def _is_bcrypt_hash(hashed: str) -> bool:
+    return hashed.startswith("$2")
 
 # Password hashing helpers
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    """Hash a password using Argon2id."""
+    return password_hasher.hash(password)
+
+def _verify_secret(secret: bytes, hashed: str) -> bool:
+    if _is_bcrypt_hash(hashed):
+        return bcrypt.checkpw(secret[:BCRYPT_MAX_PASSWORD_BYTES], hashed.encode("ascii"))
+    try:
+        return password_hasher.verify(hashed, secret)
+    except (VerificationError, InvalidHashError):
+        return False
 
 def verify_password(password: str, hashed: str) -> bool:
-    """Verify a password against its hash."""
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+    """Verify a password against its hash (Argon2id or legacy bcrypt)."""
+    return _verify_secret(password.encode(), hashed)
+
+def password_needs_rehash(hashed: str) -> bool:
+    """Whether a hash is legacy bcrypt or uses outdated Argon2 parameters."""
+    return _is_bcrypt_hash(hashed) or password_hasher.check_needs_rehash(hashed)
+
+def verify_and_update(password: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """Verify a password and, if its hash is outdated, return a new one.
+    
+    Returns (valid, new_hash); new_hash is None unless the password is valid
+    and the stored hash should be replaced.
+    """
+    secret = password.encode()
+    if not _verify_secret(secret, hashed):
+        return False, None
+    if password_needs_rehash(hashed):
+        return True, password_hasher.hash(secret)
+    return True, None
+
+# Password hashing is deliberately slow; run it off the event loop in routes
+async def hash_password_async(password: str) -> str:
+    """Hash a password in a worker thread."""
+    return await asyncio.to_thread(hash_password, password)
+
+async def verify_and_update_async(password: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """Verify (and if needed rehash) a password in a single worker-thread hop."""
+    return await asyncio.to_thread(verify_and_update, password, hashed)
 
 # Helper functions
 def create_access_token(user_id: int) -> str:
     """Create a JWT token for a user."""
-    expire = datetime.utcnow() + timedelta(days=JWT_EXPIRATION_DAYS)
+    now = datetime.utcnow()
     payload = {
         "sub": str(user_id),
-        "exp": expire
+        "iat": now,
+        "exp": now + timedelta(days=JWT_EXPIRATION_DAYS),
+        "jti": secrets.token_urlsafe(12),  # Lets this token be revoked on its own
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return _jwt.encode(payload, _jwt_key, algorithm=JWT_ALGORITHM)
 
-def verify_token(token: str) -> Optional[int]:
-    """Verify a JWT token and return user_id."""
+def _has_valid_jwt_shape(token: str) -> bool:
+    """Cheap check that a token is three segments with an HS256 header.
+    
+    Lets malformed or foreign tokens be rejected without a full decode.
+    """
+    segments = token.split(".")
+    if len(segments) != 3:
+        return False
+    header = segments[0]
+    if header in _accepted_jwt_headers:
+        return True
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = int(payload.get("sub"))
-        return user_id
-    except (JWTError, ValueError):
+        parsed = json_loads(base64url_decode(header))
+    except (ValueError, TypeError):
+        return False
+    if not isinstance(parsed, dict) or parsed.get("alg") != JWT_ALGORITHM:
+        return False
+    if len(_accepted_jwt_headers) < MAX_ACCEPTED_JWT_HEADERS:
+        _accepted_jwt_headers.add(header)
+    return True
+
+def _decode_token(token: str) -> Optional[tuple[int, float, Optional[str], Optional[float]]]:
+    """Check a token's signature and expiry and return (user_id, exp, jti, iat).
+    
+    Successful verifications are cached until the token expires, so repeat
+    requests with the same token skip the signature check and JSON parsing.
+    Revocation is not checked here.
+    """
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            if cached[1] > time.time():
+                _token_cache.move_to_end(key)
+                return cached
+            del _token_cache[key]
+    
+    if not _has_valid_jwt_shape(token):
+        return None
+    try:
+        payload = _jwt.decode(
+            token, _jwt_key, algorithms=[JWT_ALGORITHM], options=_JWT_DECODE_OPTIONS
+        )
+        iat = payload.get("iat")
+        claims = (
+            int(payload["sub"]),
+            float(payload["exp"]),
+            payload.get("jti"),  # Absent from tokens issued before revocation existed
+            float(iat) if iat is not None else None,
+        )
+    except (jwt.InvalidTokenError, ValueError, TypeError):
         return None
+    
+    with _token_cache_lock:
+        _token_cache[key] = claims
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return claims
 
-def get_current_user(
+def verify_token(token: str) -> Optional[int]:
+    """Verify a JWT token and return user_id, or None if invalid or revoked."""
+    claims = _decode_token(token)
+    if claims is None:
+        return None
+    user_id, _, jti, iat = claims
+    if token_revocation.is_revoked(jti, user_id, iat):
+        return None
+    return user_id
+
+def get_current_user_id(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Dependency to get current authenticated user from Authorization header."""
-    token = credentials.credentials
+) -> int:
+    """Dependency to get the authenticated user's id without loading the user.
     
-    user_id = verify_token(token)
+    For routes that only filter by user_id. The account itself isn't checked,
+    so routes that write rows referencing the user should use get_current_user.
+    """
+    user_id = verify_token(credentials.credentials)
     if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    user = db.query(User).filter(User.id == user_id).first()
+    return user_id
+
+# Secrets most authenticated routes never read; they load on first access
+_DEFER_CREDENTIALS = (
+    defer(User.hashed_password),
+    defer(User.anthropic_api_key),
+    defer(User.openai_api_key),
+    defer(User.github_access_token),
+)
+
+def _load_user(db: Session, user_id: int, *options) -> User:
+    """Load a user by id, raising 401 if the account no longer exists."""
+    user = db.query(User).options(*options).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
     return user
 
+def get_current_user(
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+) -> User:
+    """Dependency to get current authenticated user from Authorization header.
+    
+    Password hash and encrypted keys/tokens are deferred, so reading them
+    costs an extra query; routes that always need them should load the user
+    with _load_user instead.
+    """
+    return _load_user(db, user_id, *_DEFER_CREDENTIALS)
+
 # GitHub OAuth routes
-@router.get("/github")
+@router.get("/github", response_class=RedirectResponse, include_in_schema=False)
 async def github_login():
     """Redirect to GitHub OAuth."""
     if not GITHUB_CLIENT_ID:
         raise HTTPException(status_code=500, detail="GitHub OAuth not configured")
     
-    github_auth_url = (
-        f"https://github.com/login/oauth/authorize"
-        f"?client_id={GITHUB_CLIENT_ID}"
-        f"&scope=user:email,repo"
-    )
-    return RedirectResponse(url=github_auth_url)
+    return RedirectResponse(url=GITHUB_AUTH_URL)
 
 @router.get("/github/callback")
 async def github_callback(code: str, db: Session = Depends(get_db)):
@@ -103,17 +298,16 @@ async def github_callback(code: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="GitHub OAuth not configured")
     
     # Exchange code for access token
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(
-            "https://github.com/login/oauth/access_token",
-            data={
-                "client_id": GITHUB_CLIENT_ID,
-                "client_secret": GITHUB_CLIENT_SECRET,
-                "code": code,
-            },
-            headers={"Accept": "application/json"},
-        )
-        token_data = token_response.json()
+    token_response = await http_client.post(
+        "https://github.com/login/oauth/access_token",
+        data={
+            "client_id": GITHUB_CLIENT_ID,
+            "client_secret": GITHUB_CLIENT_SECRET,
+            "code": code,
+        },
+        headers={"Accept": "application/json"},
+    )
+    token_data = token_response.json()
     
     if "error" in token_data:
         raise HTTPException(status_code=400, detail=token_data.get("error_description", "OAuth failed"))
@@ -121,75 +315,69 @@ async def github_callback(code: str, db: Session = Depends(get_db)):
     access_token = token_data.get("access_token")
     
     # Get user info from GitHub
-    async with httpx.AsyncClient() as client:
-        user_response = await client.get(
-            "https://api.github.com/user",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/json",
-            },
-        )
-        github_user = user_response.json()
+    user_response = await http_client.get(
+        "https://api.github.com/user",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/json",
+        },
+    )
+    github_user = user_response.json()
     
-    github_id = str(github_user["id"])
+    github_id = int(github_user["id"])
     username = github_user["login"]
     email = github_user.get("email")
     avatar_url = github_user.get("avatar_url")
+    encrypted_token = await asyncio.to_thread(encrypt, access_token)
     
-    # Find or create user
-    user = db.query(User).filter(User.github_id == github_id).first()
+    # Update an existing user's info and GitHub token in one round trip
+    user_id = db.execute(
+        update(User)
+        .where(User.github_id == github_id)
+        .values(
+            avatar_url=avatar_url,
+            email=func.coalesce(email, User.email),
+            email_lower=func.coalesce(normalize_email(email), User.email_lower),
+            github_access_token=encrypted_token,  # Update encrypted GitHub token
+            last_login=datetime.utcnow(),
+        )
+        .returning(User.id)
+    ).scalar_one_or_none()
     
-    if not user:
+    if user_id is None:
         # Check if username exists
         existing_user = db.query(User).filter(User.username == username).first()
         if existing_user:
-            username = f"{username}_{github_id[:6]}"
+            username = f"{username}_{str(github_id)[:6]}"
         
         user = User(
             github_id=github_id,
             username=username,
             email=email,
             avatar_url=avatar_url,
-            github_access_token=encrypt(access_token),  # Store encrypted GitHub token
+            github_access_token=encrypted_token,  # Store encrypted GitHub token
         )
         db.add(user)
         db.commit()
-        db.refresh(user)
+        user_id = user.id
     else:
-        # Update user info and GitHub token
-        user.avatar_url = avatar_url
-        user.email = email or user.email
-        user.github_access_token = encrypt(access_token)  # Update encrypted GitHub token
-        user.last_login = datetime.utcnow()
         db.commit()
     
     # Create JWT token
-    jwt_token = create_access_token(user.id)
+    jwt_token = create_access_token(user_id)
     
     # Redirect to frontend with token
-    frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
-    return RedirectResponse(url=f"{frontend_url}/auth/callback?token={jwt_token}")
+    return RedirectResponse(url=f"{FRONTEND_URL}/auth/callback?token={jwt_token}")
 
 
 # Google OAuth routes
-@router.get("/google")
+@router.get("/google", response_class=RedirectResponse, include_in_schema=False)
 async def google_login():
     """Redirect to Google OAuth."""
     if not GOOGLE_CLIENT_ID:
         raise HTTPException(status_code=500, detail="Google OAuth not configured")
     
-    frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
-    redirect_uri = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/api/auth/google/callback")
-    
-    google_auth_url = (
-        f"https://accounts.google.com/o/oauth2/v2/auth"
-        f"?client_id={GOOGLE_CLIENT_ID}"
-        f"&redirect_uri={redirect_uri}"
-        f"&response_type=code"
-        f"&scope=email%20profile"
-        f"&access_type=offline"
-    )
-    return RedirectResponse(url=google_auth_url)
+    return RedirectResponse(url=GOOGLE_AUTH_URL)
 
 
 @router.get("/google/callback")
@@ -198,22 +386,19 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
     if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="Google OAuth not configured")
     
-    redirect_uri = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/api/auth/google/callback")
-    
     # Exchange code for access token
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(
-            "https://oauth2.googleapis.com/token",
-            data={
-                "client_id": GOOGLE_CLIENT_ID,
-                "client_secret": GOOGLE_CLIENT_SECRET,
-                "code": code,
-                "grant_type": "authorization_code",
-                "redirect_uri": redirect_uri,
-            },
-            headers={"Accept": "application/json"},
-        )
-        token_data = token_response.json()
+    token_response = await http_client.post(
+        "https://oauth2.googleapis.com/token",
+        data={
+            "client_id": GOOGLE_CLIENT_ID,
+            "client_secret": GOOGLE_CLIENT_SECRET,
+            "code": code,
+            "grant_type": "authorization_code",
+            "redirect_uri": GOOGLE_REDIRECT_URI,
+        },
+        headers={"Accept": "application/json"},
+    )
+    token_data = token_response.json()
     
     if "error" in token_data:
         raise HTTPException(status_code=400, detail=token_data.get("error_description", "Google OAuth failed"))
@@ -221,35 +406,47 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
     access_token = token_data.get("access_token")
     
     # Get user info from Google
-    async with httpx.AsyncClient() as client:
-        user_response = await client.get(
-            "https://www.googleapis.com/oauth2/v2/userinfo",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/json",
-            },
-        )
-        google_user = user_response.json()
+    user_response = await http_client.get(
+        "https://www.googleapis.com/oauth2/v2/userinfo",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/json",
+        },
+    )
+    google_user = user_response.json()
     
     google_id = str(google_user["id"])
     email = google_user.get("email")
     name = google_user.get("name", "")
     picture = google_user.get("picture")
     
-    # Try to find existing user by Google ID
-    user = db.query(User).filter(User.google_id == google_id).first()
-    
-    if not user and email:
-        # Try to find by email (link accounts)
-        user = db.query(User).filter(User.email == email).first()
-        if user:
-            # Link Google to existing account
-            user.google_id = google_id
-            if not user.avatar_url:
-                user.avatar_url = picture
-            db.commit()
-    
-    if not user:
+    # Update an existing user's info in one round trip, found by Google ID...
+    user_id = db.execute(
+        update(User)
+        .where(User.google_id == google_id)
+        .values(
+            avatar_url=func.coalesce(picture, User.avatar_url),
+            email=func.coalesce(email, User.email),
+            email_lower=func.coalesce(normalize_email(email), User.email_lower),
+            last_login=datetime.utcnow(),
+        )
+        .returning(User.id)
+    ).scalar_one_or_none()
+    
+    if user_id is None and email:
+        # ...or by email, linking Google to the existing account
+        user_id = db.execute(
+            update(User)
+            .where(User.email_lower == normalize_email(email))
+            .values(
+                google_id=google_id,
+                avatar_url=func.coalesce(picture, User.avatar_url),
+                last_login=datetime.utcnow(),
+            )
+            .returning(User.id)
+        ).scalar_one_or_none()
+    
+    if user_id is None:
         # Create new user
         # Generate username from email or name
         username = email.split("@")[0] if email else name.replace(" ", "").lower()
@@ -267,23 +464,18 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
         )
         db.add(user)
         db.commit()
-        db.refresh(user)
+        user_id = user.id
     else:
-        # Update user info
-        user.avatar_url = picture or user.avatar_url
-        user.email = email or user.email
-        user.last_login = datetime.utcnow()
         db.commit()
     
     # Create JWT token
-    jwt_token = create_access_token(user.id)
+    jwt_token = create_access_token(user_id)
     
     # Redirect to frontend with token
-    frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
-    return RedirectResponse(url=f"{frontend_url}/auth/callback?token={jwt_token}")
+    return RedirectResponse(url=f"{FRONTEND_URL}/auth/callback?token={jwt_token}")
 
 
-@router.get("/github/link")
+@router.get("/github/link", response_class=RedirectResponse, include_in_schema=False)
 async def github_link_start(state: str = None):
     """
     Start GitHub OAuth flow to link GitHub to existing account.
@@ -293,13 +485,7 @@ async def github_link_start(state: str = None):
         raise HTTPException(status_code=500, detail="GitHub OAuth not configured")
     
     # Include state (JWT token) in OAuth request to identify user on callback
-    github_auth_url = (
-        f"https://github.com/login/oauth/authorize"
-        f"?client_id={GITHUB_CLIENT_ID}"
-        f"&scope=user:email,repo"
-        f"&state={state or ''}"
-    )
-    return RedirectResponse(url=github_auth_url)
+    return RedirectResponse(url=f"{GITHUB_AUTH_URL}&state={state or ''}")
 
 
 @router.get("/github/link/callback")
@@ -315,30 +501,25 @@ async def github_link_callback(
     if not GITHUB_CLIENT_ID or not GITHUB_CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="GitHub OAuth not configured")
     
-    frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
-    
     # Verify the user's JWT token from state
     if not state:
         return RedirectResponse(
-            url=f"{frontend_url}/settings?error=Missing+authentication+state"
+            url=f"{FRONTEND_URL}/settings?error=Missing+authentication+state"
         )
     
     user_id = verify_token(state)
     if not user_id:
         return RedirectResponse(
-            url=f"{frontend_url}/settings?error=Invalid+or+expired+session"
-        )
-    
-    # Get the user
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return RedirectResponse(
-            url=f"{frontend_url}/settings?error=User+not+found"
+            url=f"{FRONTEND_URL}/settings?error=Invalid+or+expired+session"
         )
     
-    # Exchange code for access token
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(
+    # Get the user (in a worker thread) while exchanging the code for an
+    # access token; neither depends on the other
+    user_lookup = asyncio.ensure_future(
+        asyncio.to_thread(lambda: db.query(User).filter(User.id == user_id).first())
+    )
+    try:
+        token_response = await http_client.post(
             "https://github.com/login/oauth/access_token",
             data={
                 "client_id": GITHUB_CLIENT_ID,
@@ -347,27 +528,37 @@ async def github_link_callback(
             },
             headers={"Accept": "application/json"},
         )
-        token_data = token_response.json()
+    except BaseException:
+        # The lookup uses the request's Session, which is closed once this
+        # request ends; Sessions aren't thread-safe, so let it finish first
+        await asyncio.wait([user_lookup])
+        raise
+    user = await user_lookup
+    if not user:
+        return RedirectResponse(
+            url=f"{FRONTEND_URL}/settings?error=User+not+found"
+        )
+    
+    token_data = token_response.json()
     
     if "error" in token_data:
         return RedirectResponse(
-            url=f"{frontend_url}/settings?error={token_data.get('error_description', 'OAuth+failed')}"
+            url=f"{FRONTEND_URL}/settings?error={token_data.get('error_description', 'OAuth+failed')}"
         )
     
     access_token = token_data.get("access_token")
     
     # Get GitHub user info
-    async with httpx.AsyncClient() as client:
-        user_response = await client.get(
-            "https://api.github.com/user",
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/json",
-            },
-        )
-        github_user = user_response.json()
+    user_response = await http_client.get(
+        "https://api.github.com/user",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/json",
+        },
+    )
+    github_user = user_response.json()
     
-    github_id = str(github_user["id"])
+    github_id = int(github_user["id"])
     
     # Check if this GitHub account is already linked to another user
     existing_github_user = db.query(User).filter(
@@ -377,7 +568,7 @@ async def github_link_callback(
     
     if existing_github_user:
         return RedirectResponse(
-            url=f"{frontend_url}/settings?error=GitHub+account+already+linked+to+another+user"
+            url=f"{FRONTEND_URL}/settings?error=GitHub+account+already+linked+to+another+user"
         )
     
     # Import encrypt here to avoid circular imports at top
@@ -385,45 +576,38 @@ async def github_link_callback(
     
     # Link GitHub to user's account
     user.github_id = github_id
-    user.github_access_token = encrypt(access_token)
+    user.github_access_token = await asyncio.to_thread(encrypt, access_token)
     if not user.avatar_url:
         user.avatar_url = github_user.get("avatar_url")
     db.commit()
     
     # Redirect back to settings with success
     return RedirectResponse(
-        url=f"{frontend_url}/settings?github_linked=true"
+        url=f"{FRONTEND_URL}/settings?github_linked=true"
     )
 
 
 @router.get("/me", response_model=UserResponse)
 async def get_me(
-    user: User = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
 ):
     """Get current user info."""
-    return UserResponse(
-        id=user.id,
-        email=user.email,
-        username=user.username,
-        avatar_url=user.avatar_url,
-        tokens_used=user.tokens_used,
-        tokens_limit=user.tokens_limit,
-        is_premium=user.is_premium,
-        has_anthropic_key=bool(user.anthropic_api_key),
-        has_openai_key=bool(user.openai_api_key),
-        has_github=bool(user.github_access_token),
-        created_at=user.created_at,
-    )
+    # The has_* flags read every credential column, so load the full row
+    return UserResponse.model_validate(_load_user(db, user_id))
 
 @router.post("/logout")
-async def logout():
-    """Logout user (client should delete token)."""
+def logout(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    """Logout user, revoking the presented token (client should still delete it)."""
+    claims = _decode_token(credentials.credentials) if credentials else None
+    if claims is not None:
+        _, exp, jti, _ = claims
+        if jti:
+            token_revocation.revoke_token(jti, exp)
     return {"message": "Logged out successfully"}
 
-from pydantic import BaseModel, EmailStr
-from ..utils.encryption import encrypt, decrypt
-
-
 # Email Auth schemas
 class RegisterRequest(BaseModel):
     email: EmailStr
@@ -444,19 +628,7 @@ def _create_auth_response(user: User, db: Session) -> dict:
     token = create_access_token(user.id)
     return {
         "token": token,
-        "user": UserResponse(
-            id=user.id,
-            email=user.email,
-            username=user.username,
-            avatar_url=user.avatar_url,
-            tokens_used=user.tokens_used,
-            tokens_limit=user.tokens_limit,
-            is_premium=user.is_premium,
-            has_anthropic_key=bool(user.anthropic_api_key),
-            has_openai_key=bool(user.openai_api_key),
-            has_github=bool(user.github_access_token),
-            created_at=user.created_at,
-        )
+        "user": UserResponse.model_validate(user),
     }
 
 
@@ -467,7 +639,7 @@ async def register(
 ):
     """Register a new user with email and password."""
     # Check if email already exists
-    existing_user = db.query(User).filter(User.email == request.email).first()
+    existing_user = db.query(User).filter(User.email_lower == normalize_email(request.email)).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -487,7 +659,7 @@ async def register(
         username = f"{username}_{random.randint(1000, 9999)}"
     
     # Hash password
-    hashed_password = hash_password(request.password)
+    hashed_password = await hash_password_async(request.password)
     
     # Create user
     user = User(
@@ -496,12 +668,7 @@ async def register(
         hashed_password=hashed_password,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
-    
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.commit()
+    db.commit()  # last_login defaults to now on insert
     
     return _create_auth_response(user, db)
 
@@ -513,7 +680,7 @@ async def login(
 ):
     """Login with email and password."""
     # Find user by email
-    user = db.query(User).filter(User.email == request.email).first()
+    user = db.query(User).filter(User.email_lower == normalize_email(request.email)).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -528,12 +695,17 @@ async def login(
         )
     
     # Verify password
-    if not verify_password(request.password, user.hashed_password):
+    valid, new_hash = await verify_and_update_async(request.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
+    # Upgrade legacy bcrypt (or outdated Argon2) hashes now that we have the password
+    if new_hash:
+        user.hashed_password = new_hash
+    
     # Update last login
     user.last_login = datetime.utcnow()
     db.commit()
@@ -599,7 +771,7 @@ async def save_api_key(
             detail="Invalid API key format. Anthropic keys start with 'sk-ant-'"
         )
 
-    user.anthropic_api_key = encrypt(api_key)
+    user.anthropic_api_key = await asyncio.to_thread(encrypt, api_key)
     db.commit()
 
     return {"success": True}
@@ -619,7 +791,7 @@ async def save_openai_key(
             detail="Invalid API key format. OpenAI keys start with 'sk-'"
         )
 
-    user.openai_api_key = encrypt(api_key)
+    user.openai_api_key = await asyncio.to_thread(encrypt, api_key)
     db.commit()
 
     return {"success": True}
@@ -627,12 +799,21 @@ async def save_openai_key(
 
 @router.delete("/api-key")
 async def remove_api_key(
-    user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
     """Remove user's API key."""
-    user.anthropic_api_key = None
-    user.openai_api_key = None
+    result = db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(anthropic_api_key=None, openai_api_key=None)
+    )
+    if result.rowcount == 0:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     db.commit()
     
     return {"success": True, "message": "API key removed"}
@@ -656,6 +837,10 @@ async def delete_account(
     db.delete(user)
     db.commit()
     
+    # Tokens already issued would otherwise stay valid for routes that only
+    # check the token, not the account
+    token_revocation.revoke_user_tokens(user_id, timedelta(days=JWT_EXPIRATION_DAYS).total_seconds())
+    
     return {"success": True, "message": "Account deleted"}
 
 
@@ -1,13 +1,15 @@
+import asyncio
 import os
 import httpx
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from ..db.database import get_db
 from ..db.models import User, ConnectedRepo
 from ..db.schemas import RepoResponse, ConnectRepoRequest
-from .auth import get_current_user
+from .auth import get_current_user, get_current_user_id
 
 router = APIRouter(prefix="/repos", tags=["repos"])
 
@@ -21,7 +23,7 @@ async def list_github_repos(user: User = Depends(get_current_user)):
     from ..utils.encryption import decrypt
 
     try:
-        github_token = decrypt(user.github_access_token)
+        github_token = await asyncio.to_thread(decrypt, user.github_access_token)
     except ValueError:
         raise HTTPException(400, "GitHub token could not be decrypted. Please re-link your GitHub account.")
 
@@ -63,12 +65,14 @@ async def list_github_repos(user: User = Depends(get_current_user)):
 
 @router.get("/", response_model=List[RepoResponse])
 async def list_connected_repos(
-    user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """List user's connected repositories."""
-    repos = db.query(ConnectedRepo).filter(ConnectedRepo.user_id == user.id).all()
-    return repos
+    # RepoResponse reads only column attributes, so this is the only query
+    return db.scalars(
+        select(ConnectedRepo).where(ConnectedRepo.user_id == user_id)
+    ).all()
 
 
 @router.post("/connect", response_model=RepoResponse)
@@ -104,13 +108,13 @@ async def connect_repo(
 @router.delete("/{repo_id}")
 async def disconnect_repo(
     repo_id: int,
-    user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
     """Disconnect a repository."""
     repo = db.query(ConnectedRepo).filter(
         ConnectedRepo.id == repo_id,
-        ConnectedRepo.user_id == user.id
+        ConnectedRepo.user_id == user_id
     ).first()
     
     if not repo:
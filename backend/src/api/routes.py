@@ -1,14 +1,19 @@
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Query, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
+import os
+import time
+from pathlib import Path
 from ..agent.orchestrator import Agent
-from ..agent.state import Phase
-from .streaming import StreamingCallback
-from .auth import verify_token, get_user_api_key, get_current_user
-from ..db.database import SessionLocal, get_db
+from ..agent.state import Phase, PHASE_VALUES
+from .streaming import StreamingCallback, ACK_WINDOW
+from .auth import verify_token, get_user_api_key, get_current_user, get_current_user_id
+from ..db.database import get_db, get_sessionmaker
 from ..db.models import User
-from ..db.token_tracker import check_token_limit
 from ..utils.repo_manager import get_repo_manager, RepoError
 from ..utils.github_client import (
     create_pr_for_changes, 
@@ -18,6 +23,7 @@ from ..utils.github_client import (
     GitHubNotFoundError
 )
 from ..utils.encryption import decrypt
+from ..utils.json_compat import dumps
 from ..tools.file_ops import set_working_dir
 from sqlalchemy.orm import Session
 
@@ -25,15 +31,18 @@ router = APIRouter()
 
 
 def get_user_from_token(token: str) -> Optional[User]:
-    """Validate token and return user from database."""
+    """Validate token and return user from database.
+    
+    Uses its own short-lived session rather than a request-scoped one, which
+    would keep a pooled connection checked out for the whole WebSocket.
+    """
     user_id = verify_token(token)
     if not user_id:
         return None
     
-    db = SessionLocal()
+    db = get_sessionmaker()()
     try:
-        user = db.query(User).filter(User.id == user_id).first()
-        return user
+        return db.get(User, user_id)
     finally:
         db.close()
 
@@ -53,9 +62,89 @@ class ApprovalResponse(BaseModel):
     pr_url: Optional[str] = None
     pr_number: Optional[int] = None
 
-# Store agent state (in production, use proper session management)
-_current_agent: Optional[Agent] = None
-_current_repo_info: Optional[dict] = None  # Store repo info for PR creation
+# Clones can take many seconds; give them their own threads so they can't
+# exhaust the default executor that short blocking calls (DB, password
+# hashing, agent tools) rely on
+repo_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("KODA_REPO_POOL", "4")), thread_name_prefix="repo"
+)
+
+def shutdown_executors() -> None:
+    """Stop the repo thread pool (called on app shutdown)."""
+    repo_executor.shutdown(wait=False, cancel_futures=True)
+
+# One clone/pull at a time per checkout (user id, owner, repo): concurrent git
+# runs on the same directory would corrupt it. Web sessions never write to
+# the checkout, so one updated within REPO_FRESH_SECONDS is reused as is.
+_repo_locks: dict[tuple[int, str, str], asyncio.Lock] = {}
+_fresh_repos: dict[tuple[int, str, str], tuple[Path, str, float]] = {}
+REPO_FRESH_SECONDS = 60
+
+async def _get_repo_path(repo_url: str, user_id: int, branch: str) -> Path:
+    """Clone or update a user's checkout of a repo in the repo thread pool."""
+    repo_manager = get_repo_manager()
+    owner, repo, url_branch = repo_manager.parse_github_url(repo_url)
+    actual_branch = url_branch or branch
+    key = (user_id, owner, repo)
+    
+    async with _repo_locks.setdefault(key, asyncio.Lock()):
+        fresh = _fresh_repos.get(key)
+        if (
+            fresh is not None
+            and fresh[1] == actual_branch
+            and time.monotonic() - fresh[2] < REPO_FRESH_SECONDS
+            and fresh[0].exists()
+        ):
+            return fresh[0]
+        
+        _fresh_repos.pop(key, None)
+        loop = asyncio.get_running_loop()
+        repo_path = await loop.run_in_executor(
+            repo_executor,
+            repo_manager.get_repo_path,
+            repo_url,
+            user_id,
+            actual_branch
+        )
+        _fresh_repos[key] = (repo_path, actual_branch, time.monotonic())
+        return repo_path
+
+@dataclass
+class AgentSession:
+    """An agent run and the repo info needed to approve its changes."""
+    agent: Agent
+    repo_info: dict  # repo_url, branch, task for PR creation
+    github_token: Optional[str] = None  # Decrypted once per run, for PR creation
+    owner: Optional[str] = None  # Parsed from repo_url when the run started
+    repo_name: Optional[str] = None
+    # Staged changes as sent to the client (path, changeType, newContent),
+    # reused to build the PR
+    staged_snapshot: Optional[list[dict]] = None
+    created: float = field(default_factory=time.monotonic)
+
+# Latest agent run per user id, so users only ever see and approve their own
+# changes. Only touched from the event loop, so no lock is needed, but a new
+# run can replace a user's entry while an approval awaits; see _end_session.
+_sessions: dict[int, AgentSession] = {}
+SESSION_TTL_SECONDS = 60 * 60
+
+def _expire_sessions() -> None:
+    cutoff = time.monotonic() - SESSION_TTL_SECONDS
+    for user_id in [uid for uid, session in _sessions.items() if session.created < cutoff]:
+        del _sessions[user_id]
+
+def _end_session(user_id: int, session: AgentSession) -> None:
+    """Forget a finished session, unless a newer run has replaced it."""
+    if _sessions.get(user_id) is session:
+        del _sessions[user_id]
+
+def _get_session(user_id: int) -> AgentSession:
+    """Return the user's pending agent session or raise 400."""
+    _expire_sessions()
+    session = _sessions.get(user_id)
+    if session is None or not session.agent.change_manager:
+        raise HTTPException(status_code=400, detail="No pending changes")
+    return session
 
 @router.post("/approve", response_model=ApprovalResponse)
 async def approve_changes(
@@ -63,30 +152,31 @@ async def approve_changes(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    global _current_agent, _current_repo_info
-    
-    if not _current_agent or not _current_agent.change_manager:
-        raise HTTPException(status_code=400, detail="No pending changes")
-    
-    changes = _current_agent.change_manager.get_staged_changes()
+    session = _get_session(user.id)
+    change_manager = session.agent.change_manager
+    repo_info = session.repo_info
     
     if not request.approved:
         # Reject: discard all changes
-        result = _current_agent.change_manager.discard_all()
+        result = change_manager.discard_all()
+        _end_session(user.id, session)
         return ApprovalResponse(success=True, message=result)
     
     # Approved: create PR if repo info available
-    repo_url = request.repo_url or (_current_repo_info or {}).get("repo_url")
-    branch = request.branch or (_current_repo_info or {}).get("branch", "main")
-    task_desc = request.task_description or (_current_repo_info or {}).get("task", "Koda changes")
+    repo_url = request.repo_url or repo_info.get("repo_url")
+    branch = request.branch or repo_info.get("branch", "main")
+    task_desc = request.task_description or repo_info.get("task", "Koda changes")
     
     if not repo_url:
         # No repo URL - just apply locally (CLI mode)
-        result = _current_agent.change_manager.apply_all()
+        result = change_manager.apply_all()
+        _end_session(user.id, session)
         return ApprovalResponse(success=True, message=result)
     
-    # Check if user has GitHub token
-    if not user.github_access_token:
+    # Check if user has GitHub token (the session holds it already decrypted
+    # if it was linked when the task started)
+    github_token = session.github_token
+    if github_token is None and not user.github_access_token:
         raise HTTPException(
             status_code=400,
             detail="GitHub token not available. Please re-authenticate with GitHub to create PRs."
@@ -94,24 +184,31 @@ async def approve_changes(
     
     try:
         # Decrypt GitHub token
-        github_token = decrypt(user.github_access_token)
+        if github_token is None:
+            github_token = await asyncio.to_thread(decrypt, user.github_access_token)
         
-        # Parse repo URL to get owner/repo
-        from ..utils.repo_manager import get_repo_manager
-        repo_manager = get_repo_manager()
-        owner, repo_name, _ = repo_manager.parse_github_url(repo_url)
+        # Owner/repo were parsed when the run started, unless the request
+        # names a different repo
+        if repo_url == repo_info.get("repo_url") and session.owner:
+            owner, repo_name = session.owner, session.repo_name
+        else:
+            owner, repo_name, _ = get_repo_manager().parse_github_url(repo_url)
         
-        # Convert staged changes to the format expected by github_client
-        changes_for_pr = []
-        for change in changes:
-            changes_for_pr.append({
-                "path": change.path,
-                "changeType": change.change_type.value,
-                "newContent": change.new_content,
-            })
+        # Staged changes in the format expected by github_client, as
+        # captured when they were sent to the client
+        changes_for_pr = session.staged_snapshot
+        if changes_for_pr is None:
+            changes_for_pr = [
+                {
+                    "path": change.path,
+                    "changeType": change.change_type.value,
+                    "newContent": change.new_content,
+                }
+                for change in change_manager.get_staged_changes()
+            ]
         
         # Create PR
-        pr_result = create_pr_for_changes(
+        pr_result = await create_pr_for_changes(
             access_token=github_token,
             owner=owner,
             repo=repo_name,
@@ -121,7 +218,8 @@ async def approve_changes(
         )
         
         # Discard local staged changes (they're now in the PR)
-        _current_agent.change_manager.discard_all()
+        change_manager.discard_all()
+        _end_session(user.id, session)
         
         return ApprovalResponse(
             success=True,
@@ -148,38 +246,28 @@ async def approve_changes(
 
 @router.get("/changes/diff")
 async def get_changes_diff(
-    user: User = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
 ):
     """Get unified diff of all staged changes."""
-    global _current_agent
-    
-    if not _current_agent or not _current_agent.change_manager:
-        raise HTTPException(status_code=400, detail="No pending changes")
-    
-    diff = _current_agent.change_manager.get_diff()
+    session = _get_session(user_id)
+    diff = session.agent.change_manager.get_diff()
     return {"diff": diff}
 
 
 @router.get("/changes/patch")
 async def get_changes_patch(
-    user: User = Depends(get_current_user)
+    user_id: int = Depends(get_current_user_id)
 ):
     """
     Get a .patch file for all staged changes.
     Returns the diff as a downloadable file.
     """
-    from fastapi.responses import PlainTextResponse
-    
-    global _current_agent
-    
-    if not _current_agent or not _current_agent.change_manager:
-        raise HTTPException(status_code=400, detail="No pending changes")
-    
-    diff = _current_agent.change_manager.get_diff()
+    session = _get_session(user_id)
     
-    # Return as downloadable patch file
-    return PlainTextResponse(
-        content=diff,
+    # Stream as a downloadable patch file, one file's diff at a time (the
+    # sync iterator runs in the threadpool, off the event loop)
+    return StreamingResponse(
+        session.agent.change_manager.iter_diffs(),
         media_type="text/x-patch",
         headers={
             "Content-Disposition": "attachment; filename=koda-changes.patch"
@@ -191,6 +279,18 @@ async def get_changes_patch(
 async def health_check():
     return {"status": "ok"}
 
+async def _read_acks(websocket: WebSocket, callback: StreamingCallback) -> None:
+    """Feed the client's acks to the callback until the client goes away."""
+    try:
+        while True:
+            message = await websocket.receive_json()
+            if message.get("type") == "ack":
+                callback.ack(int(message.get("seq", 0)))
+    except Exception:
+        pass  # Disconnected or sent something that isn't an ack
+    finally:
+        callback.release()
+
 @router.websocket("/ws/task")
 async def websocket_task(
     websocket: WebSocket,
@@ -211,6 +311,8 @@ async def websocket_task(
     # Log authenticated connection
     print(f"WebSocket connected: user_id={user.id}, username={user.username}")
     
+    callback: Optional[StreamingCallback] = None
+    ack_reader: Optional[asyncio.Task] = None
     try:
         # Receive task from client
         data = await websocket.receive_json()
@@ -222,22 +324,11 @@ async def websocket_task(
             await websocket.send_json({"type": "error", "data": {"message": "No task provided"}})
             return
         
-        # Refresh user from DB to get latest token count
-        db = SessionLocal()
-        try:
-            fresh_user = db.query(User).filter(User.id == user.id).first()
-            if not fresh_user:
-                await websocket.send_json({"type": "error", "data": {"message": "User not found"}})
-                return
-            user = fresh_user
-        finally:
-            db.close()
-        
         # Get user's API key - try Anthropic first, then OpenAI
-        user_api_key = get_user_api_key(user, provider="anthropic")
+        user_api_key = await asyncio.to_thread(get_user_api_key, user, "anthropic")
         llm_provider = "anthropic"
         if not user_api_key:
-            user_api_key = get_user_api_key(user, provider="openai")
+            user_api_key = await asyncio.to_thread(get_user_api_key, user, "openai")
             llm_provider = "openai"
 
         # Require API key to run tasks
@@ -266,25 +357,19 @@ async def websocket_task(
         
         # Clone or update repository if repo_url provided
         repo_path = None
+        owner = repo_name = None
         if repo_url:
             try:
+                owner, repo_name, _ = get_repo_manager().parse_github_url(repo_url)
                 await websocket.send_json({
                     "type": "phase",
                     "data": {"phase": "cloning"}
                 })
                 
-                repo_manager = get_repo_manager()
-                # Run clone in thread pool to not block
-                loop = asyncio.get_event_loop()
-                repo_path = await loop.run_in_executor(
-                    None,
-                    repo_manager.get_repo_path,
-                    repo_url,
-                    user.id,
-                    branch
-                )
+                repo_path = await _get_repo_path(repo_url, user.id, branch)
                 
-                # Set working directory for file operations
+                # Set working directory for file operations (for this
+                # connection's task only, see file_ops)
                 set_working_dir(repo_path)
                 
                 print(f"Repository ready: {repo_path}")
@@ -300,7 +385,11 @@ async def websocket_task(
                 return
         
         # Create callback handler
-        callback = StreamingCallback(websocket)
+        if data.get("ack"):
+            callback = StreamingCallback(websocket, window=ACK_WINDOW)
+            ack_reader = asyncio.create_task(_read_acks(websocket, callback))
+        else:
+            callback = StreamingCallback(websocket)
         
         # Create agent with callbacks
         # Pass user's API key if available, otherwise agent will use server's key
@@ -313,54 +402,75 @@ async def websocket_task(
             repo_path=str(repo_path) if repo_path else None,
             callbacks={
                 "phase_change": callback.on_phase_change,
-                "tool_call": lambda d: callback.on_tool_call(d["name"], d["args"]),
-                "tool_result": lambda d: callback.on_tool_result(d["name"], d["result"]),
+                "tool_call": callback.on_tool_call,
+                "tool_result": callback.on_tool_result,
                 "summary": callback.on_summary,
                 "plan": callback.on_plan,
             }
         )
         
-        # Store for approval endpoint (with user context)
-        global _current_agent, _current_repo_info
-        _current_agent = agent
-        _current_repo_info = {
-            "repo_url": repo_url,
-            "branch": branch,
-            "task": task,
-            "user_id": user.id,
-        }
+        github_token = None
+        if repo_url and user.github_access_token:
+            try:
+                github_token = await asyncio.to_thread(decrypt, user.github_access_token)
+            except ValueError:
+                pass  # Approval decrypts again and reports the error
         
-        # Run in thread pool to not block
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, agent.run, task)
+        # Store for approval endpoint, replacing this user's previous run
+        _expire_sessions()
+        session = _sessions[user.id] = AgentSession(
+            agent=agent,
+            repo_info={
+                "repo_url": repo_url,
+                "branch": branch,
+                "task": task,
+            },
+            github_token=github_token,
+            owner=owner,
+            repo_name=repo_name,
+        )
+        
+        await agent.arun(task)
         
-        # Send final state with changes
-        changes = []
+        # Deliver queued events before the final message
+        await callback.close()
+        
+        # Send staged changes one frame each, so no single message holds
+        # every file's contents, then the final state
         if agent.change_manager:
+            snapshot = []
             for change in agent.change_manager.get_staged_changes():
-                changes.append({
+                staged = {
                     "path": change.path,
                     "changeType": change.change_type.value,
                     "newContent": change.new_content,
-                    "originalContent": change.original_content,
-                })
+                }
+                snapshot.append(staged)
+                await websocket.send_text(dumps({
+                    "type": "change",
+                    "data": {**staged, "originalContent": change.load_original_content()},
+                }))
+            session.staged_snapshot = snapshot
         
-        await websocket.send_json({
+        await websocket.send_text(dumps({
             "type": "complete",
             "data": {
-                "phase": agent.get_state().phase.value,
-                "changes": changes,
+                "phase": PHASE_VALUES[agent.get_state().phase],
             }
-        })
+        }))
         
     except WebSocketDisconnect:
         print(f"WebSocket disconnected: user_id={user.id}")
     except Exception as e:
         print(f"WebSocket error for user {user.id}: {type(e).__name__}: {e}")
+        if callback is not None:
+            await callback.close()
         try:
             await websocket.send_json({"type": "error", "data": {"message": str(e)}})
         except Exception:
             pass  # Connection may already be closed
     finally:
-        # Reset working directory
-        set_working_dir(None)
+        if callback is not None:
+            await callback.close()
+        if ack_reader is not None:
+            ack_reader.cancel()
@@ -10,30 +10,42 @@ if home_env.exists():
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import router
-from .auth import router as auth_router
+from .routes import router, shutdown_executors
+from .auth import router as auth_router, close_http_client
 from .repos import router as repos_router
-from .tasks import router as tasks_router
-from ..db.database import init_db
+from .tasks import router as tasks_router, close_task_updates
+from ..db.database import init_db, warm_pool
+from ..utils.github_client import close_http_client as close_github_client
 
 app = FastAPI(title="Koda API", version="1.0.0")
 
 @app.on_event("startup")
 def startup():
     init_db()
+    warm_pool()
 
-allowed_origins = [
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+    await close_github_client()
+    await close_task_updates()
+    shutdown_executors()
+
+allowed_origins = {
     "http://localhost:5173",
     "http://127.0.0.1:5173",
     "http://localhost:3000",
-]
+}
 frontend_url = os.getenv("FRONTEND_URL")
 if frontend_url:
-    allowed_origins.append(frontend_url)
+    allowed_origins.add(frontend_url)
 
+# Checked with a set lookup on every request. Origins that can't be listed
+# up front (e.g. preview deployments) can be allowed by a regex instead.
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,
+    allow_origins=frozenset(allowed_origins),
+    allow_origin_regex=os.getenv("CORS_ORIGIN_REGEX"),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -1,48 +1,151 @@
 from fastapi import WebSocket
-from typing import Callable
-import json
+from collections import deque
 import asyncio
+import threading
+from typing import Optional
+from ..utils.json_compat import dumps
+
+# Events buffered per connection while the client is slow to read. Past this,
+# the oldest queued tool call is dropped together with its result to make
+# room, or failing that the oldest tool event of either kind. Only if none
+# are queued does the oldest event of any type go. At most one plan event is
+# queued at a time (see _enqueue).
+MAX_PENDING_EVENTS = 256
+
+# Events a client that acknowledges them may have in flight. Clients opt in
+# by sending "ack": true with the task; each event then carries a "seq" and
+# the client sends {"type": "ack", "seq": n} for the last one it handled
+# (every ACK_WINDOW // 4 events or so). Past the window, events wait in the
+# queue above, where the drop policy applies, instead of in socket buffers.
+ACK_WINDOW = 64
 
 class StreamingCallback:
-    """Callback handler that sends events to WebSocket."""
-    
-    def __init__(self, websocket: WebSocket):
+    """Callback handler that sends events to WebSocket.
+
+    Must be created on the WebSocket's event loop. The on_* hooks may be
+    called from the loop or from worker threads; events are queued and sent
+    in order by a single writer task.
+
+    With a window, events are numbered and at most that many are sent ahead
+    of the client's acks (see ACK_WINDOW).
+    """
+
+    def __init__(self, websocket: WebSocket, window: Optional[int] = None):
         self.websocket = websocket
-        self.loop = asyncio.get_event_loop()
-    
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._pending: deque[dict] = deque()
+        self._ready = asyncio.Event()
+        self._closing = False
+        self._window = window
+        self._seq = 0  # Last event sent
+        self._acked = 0  # Last event the client acknowledged
+        self._ack_received = asyncio.Event()
+        self._writer = self.loop.create_task(self._pump())
+
     async def send(self, event_type: str, data: dict):
-        await self.websocket.send_json({
+        await self.websocket.send_text(dumps({
             "type": event_type,
             "data": data
-        })
-    
+        }))
+
+    async def _pump(self):
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            if self._window is not None:
+                if self._seq - self._acked >= self._window:
+                    self._ack_received.clear()
+                    await self._ack_received.wait()
+                    continue
+                self._seq += 1
+                self._pending[0]["seq"] = self._seq
+            await self.websocket.send_text(dumps(self._pending.popleft()))
+
+    def ack(self, seq: int):
+        """Record the client's ack of every event up to seq."""
+        if seq > self._acked:
+            self._acked = min(seq, self._seq)
+            self._ack_received.set()
+
+    def release(self):
+        """Stop waiting for acks (the client left or stopped reading them)."""
+        self._window = None
+        self._ack_received.set()
+
+    def _drop_oldest_tool_call(self) -> bool:
+        # Calls and results are matched by tool name on the client, so a call
+        # is preferably dropped along with its result to keep the rest paired
+        pending = self._pending
+        for i, event in enumerate(pending):
+            if event["type"] != "tool_call":
+                continue
+            name = event["data"]["name"]
+            for j in range(i + 1, len(pending)):
+                if pending[j]["type"] == "tool_result" and pending[j]["data"]["name"] == name:
+                    del pending[j]
+                    del pending[i]
+                    return True
+        for i, event in enumerate(pending):
+            if event["type"] in ("tool_call", "tool_result"):
+                del pending[i]
+                return True
+        return False
+
+    def _enqueue(self, event: dict):
+        # Nothing more gets sent once the writer has stopped (e.g. a send failed)
+        if self._closing or self._writer.done():
+            return
+        if event["type"] == "plan":
+            # Each plan holds every step so far and replaces the last one on
+            # the client, so a queued plan is just updated in place
+            for i, queued in enumerate(self._pending):
+                if queued["type"] == "plan":
+                    self._pending[i] = event
+                    return
+        if len(self._pending) >= MAX_PENDING_EVENTS and not self._drop_oldest_tool_call():
+            self._pending.popleft()
+        self._pending.append(event)
+        self._ready.set()
+
+    def _emit(self, event_type: str, data: dict):
+        event = {"type": event_type, "data": data}
+        # Queue right away on the loop itself, so an event emitted just
+        # before close() is still sent
+        if threading.get_ident() == self._loop_thread:
+            self._enqueue(event)
+        else:
+            self.loop.call_soon_threadsafe(self._enqueue, event)
+
+    async def close(self):
+        """Send any queued events, then stop the writer.
+
+        Call before sending anything directly on the WebSocket so events
+        arrive in order. Send errors (e.g. the client left) are swallowed;
+        the handler notices the disconnect on its own.
+        """
+        self._closing = True
+        self._ready.set()
+        try:
+            await self._writer
+        except Exception:
+            pass
+
     def on_phase_change(self, phase: str):
-        asyncio.run_coroutine_threadsafe(
-            self.send("phase", {"phase": phase}),
-            self.loop
-        )
-    
+        self._emit("phase", {"phase": phase})
+
     def on_tool_call(self, name: str, args: dict):
-        asyncio.run_coroutine_threadsafe(
-            self.send("tool_call", {"name": name, "args": args}),
-            self.loop
-        )
-    
+        self._emit("tool_call", {"name": name, "args": args})
+
     def on_tool_result(self, name: str, result: str):
-        asyncio.run_coroutine_threadsafe(
-            self.send("tool_result", {"name": name, "result": result[:500]}),
-            self.loop
-        )
-    
+        self._emit("tool_result", {"name": name, "result": result[:500]})
+
     def on_summary(self, summary: str):
-        asyncio.run_coroutine_threadsafe(
-            self.send("summary", {"summary": summary}),
-            self.loop
-        )
-    
-    def on_plan(self, plan: list):
-        asyncio.run_coroutine_threadsafe(
-            self.send("plan", {"plan": plan}),
-            self.loop
-        )
+        self._emit("summary", {"summary": summary})
 
+    def on_plan(self, plan: list):
+        self._emit("plan", {"plan": plan})
@@ -1,17 +1,128 @@
 """Task history API endpoints."""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import bindparam, func, update
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
+from collections import OrderedDict
 from datetime import datetime
+import asyncio
+import hashlib
+import threading
 import uuid
 
-from ..db.database import get_db
+from ..db.database import get_db, get_sessionmaker
 from ..db.models import User, TaskHistory
-from .auth import get_current_user
+from .auth import get_current_user, get_current_user_id
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
 
+# Status/PR updates are buffered and written in one batch shortly after the
+# first one arrives, so a task's running -> complete -> pr_url transitions
+# cost one commit instead of one each. History reads flush first.
+TASK_FLUSH_DELAY_SECONDS = 0.5
+# A failed batch stays buffered and is retried, backing off up to this long
+TASK_FLUSH_MAX_RETRY_SECONDS = 30.0
+
+# Recently seen (task_id, user_id) pairs, so repeated updates to a task
+# skip the ownership lookup
+KNOWN_TASKS_CACHE_SIZE = 1024
+_known_tasks: OrderedDict[tuple[str, int], None] = OrderedDict()
+
+# (task_id, user_id) -> fields to set; later updates merge into earlier ones
+_pending_updates: dict[tuple[str, int], dict[str, str]] = {}
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()  # Keeps batches in order
+_flush_task: Optional[asyncio.Task] = None
+
+# One executemany for the whole batch. Fields an update didn't set keep their
+# value, and tasks owned by another user are left alone.
+_task_table = TaskHistory.__table__
+_UPDATE_TASK = (
+    update(_task_table)
+    .where(_task_table.c.id == bindparam("task_id"), _task_table.c.user_id == bindparam("owner_id"))
+    .values(
+        status=func.coalesce(bindparam("new_status"), _task_table.c.status),
+        pr_url=func.coalesce(bindparam("new_pr_url"), _task_table.c.pr_url),
+    )
+)
+
+
+def _remember_task(task_id: str, user_id: int) -> None:
+    with _pending_lock:
+        _known_tasks[(task_id, user_id)] = None
+        _known_tasks.move_to_end((task_id, user_id))
+        if len(_known_tasks) > KNOWN_TASKS_CACHE_SIZE:
+            _known_tasks.popitem(last=False)
+
+
+def _is_known_task(task_id: str, user_id: int) -> bool:
+    with _pending_lock:
+        if (task_id, user_id) not in _known_tasks:
+            return False
+        _known_tasks.move_to_end((task_id, user_id))
+        return True
+
+
+def flush_task_updates() -> bool:
+    """Write all buffered task updates to the database.
+    
+    Returns False if the write failed. The updates are then buffered again,
+    under any that arrived in the meantime, for the next flush.
+    """
+    with _flush_lock:
+        with _pending_lock:
+            if not _pending_updates:
+                return True
+            batch = dict(_pending_updates)
+            _pending_updates.clear()
+        rows = [
+            {
+                "task_id": task_id,
+                "owner_id": user_id,
+                "new_status": fields.get("status"),
+                "new_pr_url": fields.get("pr_url"),
+            }
+            for (task_id, user_id), fields in batch.items()
+        ]
+        
+        db = get_sessionmaker()()
+        try:
+            db.execute(_UPDATE_TASK, rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Warning: Failed to write {len(rows)} task updates, will retry: {e}")
+            with _pending_lock:
+                for key, fields in batch.items():
+                    _pending_updates[key] = {**fields, **_pending_updates.get(key, {})}
+            return False
+        finally:
+            db.close()
+        return True
+
+
+def _schedule_flush(delay: float = TASK_FLUSH_DELAY_SECONDS) -> None:
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_later(delay))
+
+
+async def _flush_later(delay: float) -> None:
+    global _flush_task
+    await asyncio.sleep(delay)
+    _flush_task = None
+    if not await asyncio.to_thread(flush_task_updates):
+        _schedule_flush(min(delay * 2, TASK_FLUSH_MAX_RETRY_SECONDS))
+
+
+async def close_task_updates() -> None:
+    """Write any buffered task updates (called on app shutdown)."""
+    if _flush_task is not None:
+        _flush_task.cancel()
+    if not await asyncio.to_thread(flush_task_updates):
+        print(f"Warning: {len(_pending_updates)} task updates were lost on shutdown")
+
 
 class TaskCreate(BaseModel):
     task: str
@@ -31,19 +142,48 @@ class TaskResponse(BaseModel):
     pr_url: Optional[str]
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
 
 
 @router.get("/", response_model=list[TaskResponse])
 async def get_task_history(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
-    """Get user's task history (last 20)."""
+    """Get user's task history (last 20).
+    
+    Answers 304 if the client's ETag still matches: any new or updated task
+    changes the user's task count or latest update time.
+    """
+    if not await asyncio.to_thread(flush_task_updates):
+        _schedule_flush()
+    last_updated, count = (
+        db.query(
+            func.max(func.coalesce(TaskHistory.updated_at, TaskHistory.created_at)),
+            func.count(),
+        )
+        .filter(TaskHistory.user_id == user_id)
+        .one()
+    )
+    version = f"{count}:{last_updated.isoformat() if last_updated else ''}"
+    etag = '"' + hashlib.blake2b(version.encode(), digest_size=8).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=2"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    
     tasks = (
         db.query(TaskHistory)
-        .filter(TaskHistory.user_id == current_user.id)
+        .filter(TaskHistory.user_id == user_id)
         .order_by(TaskHistory.created_at.desc())
         .limit(20)
         .all()
@@ -70,6 +210,7 @@ async def create_task(
     
     db.add(task)
     db.commit()
+    _remember_task(task_id, current_user.id)
     
     return {"id": task_id}
 
@@ -79,24 +220,31 @@ async def update_task(
     task_id: str,
     update_data: TaskUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    user_id: int = Depends(get_current_user_id),
 ):
-    """Update task status and/or PR URL."""
-    task = (
-        db.query(TaskHistory)
-        .filter(TaskHistory.id == task_id, TaskHistory.user_id == current_user.id)
-        .first()
-    )
+    """Update task status and/or PR URL.
     
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    The update is buffered and written shortly after.
+    """
+    if not _is_known_task(task_id, user_id):
+        task = (
+            db.query(TaskHistory.id)
+            .filter(TaskHistory.id == task_id, TaskHistory.user_id == user_id)
+            .first()
+        )
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        _remember_task(task_id, user_id)
     
+    fields = {}
     if update_data.status:
-        task.status = update_data.status
+        fields["status"] = update_data.status
     if update_data.pr_url:
-        task.pr_url = update_data.pr_url
+        fields["pr_url"] = update_data.pr_url
     
-    db.commit()
+    if fields:
+        with _pending_lock:
+            _pending_updates.setdefault((task_id, user_id), {}).update(fields)
+        _schedule_flush()
     
     return {"success": True}
-
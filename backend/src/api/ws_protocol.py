@@ -0,0 +1,25 @@
+"""uvicorn WebSocket protocol with a larger write buffer.
+
+Task results carry whole file contents and can be several MB. With the
+default 64 KiB high-water mark every send stalls waiting for the buffer to
+drain; allowing up to 1 MiB lets large messages go out in fewer writes.
+
+Nothing is written to a connection before the task handler authenticates
+and accepts it (a rejected handshake only gets a close frame), so the larger
+limit only ever applies to authenticated connections.
+
+Used by `koda serve` and run_server.py; with the uvicorn CLI pass
+`--ws src.api.ws_protocol:WebSocketProtocol`.
+"""
+import asyncio
+from uvicorn.protocols.websockets.auto import AutoWebSocketsProtocol
+
+WS_WRITE_BUFFER_LIMIT = 1024 * 1024
+
+
+class WebSocketProtocol(AutoWebSocketsProtocol):
+    """uvicorn's default WebSocket protocol with a 1 MiB write buffer."""
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        super().connection_made(transport)
+        transport.set_write_buffer_limits(high=WS_WRITE_BUFFER_LIMIT)
@@ -1,7 +1,7 @@
 import typer
 import os
+import re
 from pathlib import Path
-from ..agent.orchestrator import Agent
 from .theme import console, print_banner, print_summary
 
 app = typer.Typer(
@@ -16,31 +16,47 @@ KODA_HOME = Path.home() / ".koda"
 KODA_ENV_FILE = KODA_HOME / ".env"
 
 
+# An ANTHROPIC_API_KEY line in ~/.koda/.env, with its line break
+_ANTHROPIC_LINE_RE = re.compile(rb"(?m)^ANTHROPIC_API_KEY=.*(?:\n|$)")
+
+# The (optionally quoted) value of an ANTHROPIC_API_KEY line
+_ANTHROPIC_KEY_RE = re.compile(rb"""(?m)^ANTHROPIC_API_KEY=[ \t]*["']?([^"'\n]+?)["']?[ \t\r]*$""")
+
+
+def _bootstrap_env() -> None:
+    """Load ANTHROPIC_API_KEY from ~/.koda/.env into os.environ.
+    
+    Runs once per CLI invocation, so everything after reads the key from
+    the environment. A key in the file takes precedence over one inherited
+    from the shell.
+    """
+    try:
+        content = KODA_ENV_FILE.read_bytes()
+    except OSError:
+        return
+    # The first non-empty value wins
+    for match in _ANTHROPIC_KEY_RE.finditer(content):
+        key = match.group(1).strip()
+        if key:
+            try:
+                os.environ["ANTHROPIC_API_KEY"] = key.decode("utf-8")
+            except UnicodeDecodeError:
+                pass
+            return
+
+
 def get_api_key() -> str | None:
     """
     Get the Anthropic API key from config or environment.
     
     Checks in order:
-    1. ~/.koda/.env file (ANTHROPIC_API_KEY=...)
+    1. ~/.koda/.env file (ANTHROPIC_API_KEY=..., loaded at startup)
     2. Environment variable ANTHROPIC_API_KEY
     
     Returns:
         API key string or None if not found
     """
-    # Check ~/.koda/.env
-    if KODA_ENV_FILE.exists():
-        try:
-            content = KODA_ENV_FILE.read_text()
-            for line in content.strip().split("\n"):
-                if line.startswith("ANTHROPIC_API_KEY="):
-                    key = line.split("=", 1)[1].strip().strip('"').strip("'")
-                    if key:
-                        return key
-        except Exception:
-            pass
-    
-    # Check environment variable
-    return os.getenv("ANTHROPIC_API_KEY")
+    return os.environ.get("ANTHROPIC_API_KEY")
 
 
 def validate_api_key(key: str) -> bool:
@@ -52,20 +68,21 @@ def save_api_key(key: str) -> None:
     """Save API key to ~/.koda/.env"""
     KODA_HOME.mkdir(parents=True, exist_ok=True)
     
-    # Read existing content (if any)
-    existing_lines = []
-    if KODA_ENV_FILE.exists():
-        content = KODA_ENV_FILE.read_text()
-        for line in content.strip().split("\n"):
-            # Skip existing ANTHROPIC_API_KEY line
-            if not line.startswith("ANTHROPIC_API_KEY="):
-                existing_lines.append(line)
-    
-    # Add new key
-    existing_lines.append(f'ANTHROPIC_API_KEY="{key}"')
+    # Keep existing content (if any), minus any previous key line
+    try:
+        content = _ANTHROPIC_LINE_RE.sub(b"", KODA_ENV_FILE.read_bytes())
+    except FileNotFoundError:
+        content = b""
+    if content and not content.endswith(b"\n"):
+        content += b"\n"
     
-    # Write back
-    KODA_ENV_FILE.write_text("\n".join(existing_lines) + "\n")
+    # Add new key and write back
+    KODA_ENV_FILE.write_bytes(content + b'ANTHROPIC_API_KEY="' + key.encode("utf-8") + b'"\n')
+    os.environ["ANTHROPIC_API_KEY"] = key
+
+@app.callback()
+def main():
+    _bootstrap_env()
 
 @app.command()
 def run(
@@ -101,6 +118,9 @@ def run(
     try:
         print_banner()
         console.print(f"[muted]Working in: {repo_path}[/muted]\n")
+        # Imported here so other commands don't load the LLM and DB stack
+        from ..agent.orchestrator import Agent
+        
         # Pass the API key to the agent
         agent = Agent(headless=False, api_key=api_key)
         agent.run(task_str)
@@ -169,8 +189,11 @@ def init():
     
     # Also create local .koda directory if not exists
     local_koda_dir = Path.cwd() / ".koda"
-    if not local_koda_dir.exists():
+    try:
         local_koda_dir.mkdir(parents=True)
+    except FileExistsError:
+        pass
+    else:
         config_file = local_koda_dir / "config.json"
         config_file.write_text("{}")
         console.print(f"[muted]Created local config: {local_koda_dir}[/muted]")
@@ -183,10 +206,11 @@ def serve(
     """Start the Koda API server for the web UI."""
     import uvicorn
     from ..api.server import app as fastapi_app
+    from ..api.ws_protocol import WebSocketProtocol
     
     console.print(f"[accent]◆ Koda[/accent] API server starting...")
     console.print(f"[muted]Open http://localhost:{port} for web UI[/muted]\n")
-    uvicorn.run(fastapi_app, host=host, port=port)
+    uvicorn.run(fastapi_app, host=host, port=port, ws=WebSocketProtocol)
 
 @app.command()
 def version():
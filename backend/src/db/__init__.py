@@ -1,4 +1,4 @@
-from .database import get_db, init_db, engine, SessionLocal
+from .database import get_db, init_db, get_engine, get_sessionmaker
 from .models import User, ConnectedRepo, UserSession, TokenUsage
 from .schemas import UserCreate, UserResponse, RepoResponse, ConnectRepoRequest, Token, ApiKeyUpdate
 from .token_tracker import TokenTracker, check_token_limit
@@ -1,23 +1,47 @@
 import os
-from sqlalchemy import create_engine, inspect, text
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from sqlalchemy import Engine, Integer, String, create_engine, event, inspect, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from pathlib import Path
 
 # Check for DATABASE_URL environment variable (for production PostgreSQL)
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Render provides DATABASE_URL starting with "postgres://" but SQLAlchemy needs "postgresql://"
+if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+DB_PATH = Path.home() / ".koda" / "koda.db"
+
+Base = declarative_base()
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """Create the database engine on first use.
+    
+    Deferred so CLI commands that never touch the database don't set up a
+    pool or create ~/.koda.
+    """
+    if DATABASE_URL:
+        # Production: Use PostgreSQL
+        # Pool sized for concurrent requests plus agent threads recording usage;
+        # the default (5 + 10 overflow) times out under load. pre_ping/recycle
+        # drop connections the server has closed while idle.
+        engine = create_engine(
+            DATABASE_URL,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "40")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_pre_ping=True,
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        )
+        print(f"Using PostgreSQL database")
+        return engine
 
-if DATABASE_URL:
-    # Production: Use PostgreSQL
-    # Render provides DATABASE_URL starting with "postgres://" but SQLAlchemy needs "postgresql://"
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    SQLALCHEMY_DATABASE_URL = DATABASE_URL
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-    print(f"Using PostgreSQL database")
-else:
     # Development: Use SQLite
-    DB_PATH = Path.home() / ".koda" / "koda.db"
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
     # Set secure permissions on the .koda directory (owner-only access)
@@ -26,20 +50,44 @@ else:
     except OSError:
         pass  # May fail on some systems, non-critical
 
-    SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
+        f"sqlite:///{DB_PATH}",
         connect_args={"check_same_thread": False}
     )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
     print(f"Using SQLite database at {DB_PATH}")
+    return engine
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune each new SQLite connection for the server's concurrent use.
+
+    WAL lets readers run alongside a writer instead of being locked out, and
+    with WAL, synchronous=NORMAL is still safe against corruption while
+    skipping an fsync per commit. The rest keep temp tables and more pages
+    in memory.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        cursor.execute("PRAGMA cache_size=-20000")  # ~20 MB
+    finally:
+        cursor.close()
+
+
+@lru_cache(maxsize=1)
+def get_sessionmaker() -> sessionmaker:
+    """Session factory bound to the engine; call the result for a new Session."""
+    # expire_on_commit=False: objects stay usable after commit without a reload
+    # SELECT (sessions are request/call scoped, so they can't go stale)
+    return sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=get_engine())
 
 def get_db():
     """Dependency for getting database session."""
-    db = SessionLocal()
+    db = get_sessionmaker()()
     try:
         yield db
     finally:
@@ -47,8 +95,46 @@ def get_db():
 
 def init_db():
     """Initialize database tables and add any missing columns."""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
     _migrate_missing_columns()
+    _migrate_column_types()
+    _backfill_email_lower()
+    _migrate_missing_indexes()
+
+
+def warm_pool():
+    """Open the pool's connections up front so early requests don't pay for it.
+
+    Checks out DB_POOL_WARM connections (default: the pool size) at once, in
+    parallel, then returns them to the pool. Skipped for SQLite, where
+    connecting is just opening a file.
+    """
+    engine = get_engine()
+    if engine.dialect.name == "sqlite":
+        return
+    count = int(os.getenv("DB_POOL_WARM", str(engine.pool.size())))
+    if count <= 0:
+        return
+
+    connections = []
+
+    def connect():
+        conn = engine.connect()
+        conn.execute(text("SELECT 1"))
+        return conn
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(count, 8)) as executor:
+            futures = [executor.submit(connect) for _ in range(count)]
+            for future in futures:
+                try:
+                    connections.append(future.result())
+                except Exception as e:
+                    print(f"Warning: Could not open pooled database connection: {e}")
+    finally:
+        for conn in connections:
+            conn.close()
+    print(f"Opened {len(connections)} pooled database connections")
 
 
 def _migrate_missing_columns():
@@ -58,6 +144,7 @@ def _migrate_missing_columns():
     the tables were already created (create_all only creates new tables,
     not new columns on existing tables).
     """
+    engine = get_engine()
     inspector = inspect(engine)
     for table_name, table in Base.metadata.tables.items():
         if not inspector.has_table(table_name):
@@ -72,3 +159,67 @@ def _migrate_missing_columns():
                     )
                 print(f"Added missing column {table_name}.{column.name}")
 
+
+def _migrate_column_types():
+    """Convert text columns that models now declare as integers.
+
+    Only needed on PostgreSQL: SQLite compares an integer against a text
+    column by converting it to text, so existing rows keep matching.
+    """
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        return
+    inspector = inspect(engine)
+    for table_name, table in Base.metadata.tables.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {col["name"]: col["type"] for col in inspector.get_columns(table_name)}
+        for column in table.columns:
+            current = existing.get(column.name)
+            if (
+                current is not None
+                and isinstance(column.type, Integer)
+                and isinstance(current, String)
+            ):
+                col_type = column.type.compile(engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        f'ALTER TABLE "{table_name}" ALTER COLUMN "{column.name}" '
+                        f'TYPE {col_type} USING "{column.name}"::{col_type}'
+                    ))
+                print(f"Converted column {table_name}.{column.name} to {col_type}")
+
+
+def _backfill_email_lower():
+    """Fill users.email_lower for rows created before the column existed."""
+    with get_engine().begin() as conn:
+        result = conn.execute(text(
+            "UPDATE users SET email_lower = LOWER(email) "
+            "WHERE email_lower IS NULL AND email IS NOT NULL"
+        ))
+    if result.rowcount:
+        print(f"Backfilled email_lower for {result.rowcount} users")
+
+
+def _migrate_missing_indexes():
+    """Create indexes defined in models but missing from the database.
+
+    Like columns, indexes added to models later aren't created by
+    create_all on tables that already exist.
+    """
+    engine = get_engine()
+    inspector = inspect(engine)
+    for table_name, table in Base.metadata.tables.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table_name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                try:
+                    index.create(bind=engine)
+                except IntegrityError as e:
+                    # A unique index over data that already has duplicates;
+                    # they have to be resolved by hand before it can exist
+                    print(f"Warning: Could not add unique index {index.name}: {e.orig}")
+                    continue
+                print(f"Added missing index {index.name}")
@@ -1,19 +1,27 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, ForeignKey, Text, Index
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime
+from typing import Optional
 from .database import Base
 
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Case-folded form of an email, used for lookups and uniqueness."""
+    return email.lower() if email else None
+
 class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=True)
+    # Lowercased email, kept in sync with email, so lookups are case-insensitive
+    # and still use an index
+    email_lower = Column(String, unique=True, index=True, nullable=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String, nullable=True)  # Null for OAuth users
     
     # OAuth fields
-    github_id = Column(String, unique=True, nullable=True)
-    google_id = Column(String, unique=True, nullable=True)
+    github_id = Column(BigInteger, unique=True, nullable=True)
+    google_id = Column(String, unique=True, nullable=True)  # 21-digit ids overflow BIGINT
     avatar_url = Column(String, nullable=True)
     
     # API key (encrypted)
@@ -37,6 +45,24 @@ class User(Base):
     sessions = relationship("UserSession", back_populates="user")
     task_history = relationship("TaskHistory", back_populates="user")
 
+    @validates("email")
+    def _sync_email_lower(self, key, email):
+        self.email_lower = normalize_email(email)
+        return email
+
+    # Read by UserResponse, which never exposes the secrets themselves
+    @property
+    def has_anthropic_key(self) -> bool:
+        return bool(self.anthropic_api_key)
+
+    @property
+    def has_openai_key(self) -> bool:
+        return bool(self.openai_api_key)
+
+    @property
+    def has_github(self) -> bool:
+        return bool(self.github_access_token)
+
 class ConnectedRepo(Base):
     __tablename__ = "connected_repos"
 
@@ -56,11 +82,16 @@ class ConnectedRepo(Base):
     
     user = relationship("User", back_populates="repos")
 
+    __table_args__ = (
+        # Per-user listing and the (user, repo_name) duplicate check
+        Index("ix_connected_repos_user_id_repo_name", "user_id", "repo_name"),
+    )
+
 class UserSession(Base):
     __tablename__ = "user_sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     
     token = Column(String, unique=True, index=True)
     expires_at = Column(DateTime)
@@ -72,7 +103,7 @@ class TokenUsage(Base):
     __tablename__ = "token_usage"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     
     tokens_used = Column(Integer)
     task_description = Column(String)
@@ -89,6 +120,13 @@ class TaskHistory(Base):
     status = Column(String, default="running")  # running, complete, error
     pr_url = Column(String, nullable=True)  # if PR was created
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Changes whenever the row does; the history endpoint's ETag is built on it
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user = relationship("User", back_populates="task_history")
 
+    __table_args__ = (
+        # Recent-history query: filter by user, newest first
+        Index("ix_task_history_user_id_created_at", "user_id", "created_at"),
+    )
+
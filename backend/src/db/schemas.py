@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr
 from datetime import datetime
 from typing import Optional, List
 
@@ -11,6 +11,8 @@ class UserCreate(UserBase):
     password: Optional[str] = None
 
 class UserResponse(UserBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     avatar_url: Optional[str] = None
     tokens_used: int
@@ -21,22 +23,18 @@ class UserResponse(UserBase):
     has_github: bool  # Whether user has GitHub linked (can create PRs)
     created_at: datetime
 
-    class Config:
-        from_attributes = True
-
 # Repo schemas
 class RepoBase(BaseModel):
     repo_name: str
     repo_url: str
 
 class RepoResponse(RepoBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     default_branch: str
     last_synced: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True
-
 class ConnectRepoRequest(BaseModel):
     github_repo_id: str
     repo_name: str
@@ -1,9 +1,17 @@
 """Token usage tracking for free tier users."""
+import threading
+import time
 from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+from .database import get_sessionmaker
 from .models import User, TokenUsage
 
+# Buffered usage is written once this many records are pending...
+FLUSH_EVERY = 16
+# ...or once this long has passed since the last write
+FLUSH_INTERVAL_SECONDS = 5.0
+
 
 class TokenLimitExceeded(Exception):
     """Raised when user exceeds their token limit."""
@@ -11,48 +19,134 @@ class TokenLimitExceeded(Exception):
 
 
 class TokenTracker:
-    """Tracks token usage for a user across LLM calls."""
+    """Tracks token usage for a user across LLM calls.
+    
+    Usage is buffered in memory and written in batches; the limit check runs
+    against an in-memory running total so it stays synchronous. Call flush()
+    when the run ends so no buffered usage is lost.
+    """
     
     def __init__(self, user_id: int, check_limit: bool = True):
         self.user_id = user_id
         self.session_tokens = 0  # Tokens used in current session
         self.check_limit = check_limit  # Whether to raise exception on limit
+        self._buffer: list[tuple[int, str]] = []  # (tokens, task_description) not yet written
+        self._last_flush = time.monotonic()
+        self._tokens_used: int | None = None  # User's total incl. buffered usage (None = not loaded)
+        self._tokens_limit: int | None = None
+        self._lock = threading.Lock()  # Sync providers report usage from worker threads
     
     def record_usage(self, input_tokens: int, output_tokens: int, task_description: str = ""):
-        """Record token usage after an LLM call. Raises TokenLimitExceeded if over limit."""
+        """Record token usage and write it immediately. Raises TokenLimitExceeded if over limit."""
+        self.record_usage_buffered(input_tokens, output_tokens, task_description)
+        self.flush()
+    
+    def record_usage_buffered(self, input_tokens: int, output_tokens: int, task_description: str = ""):
+        """Record token usage after an LLM call, writing to the DB in batches.
+        
+        Raises TokenLimitExceeded if over limit (after writing what's buffered).
+        """
         total = input_tokens + output_tokens
-        self.session_tokens += total
+        with self._lock:
+            self.session_tokens += total
+            self._buffer.append((total, task_description[:200] if task_description else ""))
+            
+            if self._tokens_used is None:
+                self._load_totals()
+                if self._tokens_used is not None:
+                    # Nothing buffered is in the stored total yet, this call included
+                    self._tokens_used += sum(tokens for tokens, _ in self._buffer)
+            else:
+                self._tokens_used += total
+            
+            # Check if limit exceeded DURING execution
+            over_limit = (
+                self.check_limit
+                and self._tokens_limit is not None
+                and self._tokens_used >= self._tokens_limit
+            )
+            if (
+                over_limit
+                or len(self._buffer) >= FLUSH_EVERY
+                or time.monotonic() - self._last_flush >= FLUSH_INTERVAL_SECONDS
+            ):
+                self._flush_locked()
         
-        db = SessionLocal()
+        if over_limit:
+            raise TokenLimitExceeded(
+                f"Free tier limit reached ({self._tokens_limit:,} tokens). "
+                f"Add your API key to continue."
+            )
+    
+    def flush(self):
+        """Write all buffered usage to the database."""
+        with self._lock:
+            self._flush_locked()
+    
+    def _load_totals(self):
+        """Load the user's current usage and limit from the database."""
+        db = get_sessionmaker()()
         try:
-            # Update user's total
             user = db.query(User).filter(User.id == self.user_id).first()
             if user:
-                user.tokens_used += total
-                
-                # Record in audit table
-                usage_record = TokenUsage(
-                    user_id=self.user_id,
-                    tokens_used=total,
-                    task_description=task_description[:200] if task_description else "",
+                self._tokens_used = user.tokens_used
+                self._tokens_limit = user.tokens_limit
+        except Exception as e:
+            # Left unloaded, so the next call tries again
+            print(f"Warning: Failed to load token usage for user {self.user_id}: {e}")
+        finally:
+            db.close()
+    
+    def _flush_locked(self):
+        """Write buffered usage in one transaction. Caller must hold self._lock."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        total = sum(tokens for tokens, _ in rows)
+        
+        db = get_sessionmaker()()
+        try:
+            try:
+                # Update user's total in SQL so concurrent runs don't overwrite each other
+                updated = (
+                    db.query(User)
+                    .filter(User.id == self.user_id)
+                    .update({User.tokens_used: User.tokens_used + total}, synchronize_session=False)
                 )
-                db.add(usage_record)
-                db.commit()
-                
-                print(f"Token usage recorded: +{total} (input={input_tokens}, output={output_tokens}), total={user.tokens_used}/{user.tokens_limit}")
-                
-                # Check if limit exceeded DURING execution
-                if self.check_limit and user.tokens_used >= user.tokens_limit:
-                    raise TokenLimitExceeded(
-                        f"Free tier limit reached ({user.tokens_limit:,} tokens). "
-                        f"Add your API key to continue."
+                if updated:
+                    # Record in audit table (one executemany for the whole batch)
+                    db.execute(
+                        insert(TokenUsage),
+                        [
+                            {"user_id": self.user_id, "tokens_used": tokens, "task_description": task}
+                            for tokens, task in rows
+                        ],
                     )
+                    db.commit()
+            except Exception as e:
+                # Keep the usage for the next flush; the LLM calls it covers
+                # already succeeded, so don't fail the run over it
+                db.rollback()
+                self._buffer[:0] = rows
+                print(f"Warning: Failed to record token usage for user {self.user_id}, will retry: {e}")
+                return
+            
+            if updated:
+                # Resync with the stored total, which includes other runs' usage
+                user = db.query(User).filter(User.id == self.user_id).first()
+                self._tokens_used = user.tokens_used
+                self._tokens_limit = user.tokens_limit
+                
+                print(f"Token usage recorded: +{total} ({len(rows)} calls), total={user.tokens_used}/{user.tokens_limit}")
+        except Exception as e:
+            print(f"Warning: Failed to reload token usage for user {self.user_id}: {e}")
         finally:
             db.close()
     
     def get_remaining(self) -> int:
         """Get remaining tokens for the user."""
-        db = SessionLocal()
+        db = get_sessionmaker()()
         try:
             user = db.query(User).filter(User.id == self.user_id).first()
             if user:
@@ -1 +1 @@
-from .client import get_provider, chat, chat_with_tools
\ No newline at end of file
+from .client import get_provider, chat, chat_with_tools, achat, achat_with_tools, astream_chat
\ No newline at end of file
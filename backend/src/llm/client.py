@@ -21,7 +21,7 @@ SUPPORTED_PROVIDERS = {
     "openai": OpenAIProvider,
 }
 
-from typing import Callable
+from typing import AsyncIterator, Callable
 
 def get_provider(
     api_key: str | None = None,
@@ -97,3 +97,39 @@ def chat_with_tools(
     """
     p = get_provider(api_key=api_key, on_usage=on_usage, provider=provider)
     return p.chat_with_tools(messages, tools, phase=phase)
+
+async def achat(
+    prompt: str,
+    api_key: str | None = None,
+    on_usage: Callable[[int, int], None] | None = None,
+    phase: str | None = None,
+    provider: str | None = None
+) -> str:
+    """Async version of chat(); doesn't block the event loop during the request."""
+    p = get_provider(api_key=api_key, on_usage=on_usage, provider=provider)
+    return await p.achat(prompt, phase=phase)
+
+async def achat_with_tools(
+    messages: list,
+    tools: list,
+    api_key: str | None = None,
+    on_usage: Callable[[int, int], None] | None = None,
+    phase: str | None = None,
+    provider: str | None = None
+) -> dict:
+    """Async version of chat_with_tools(); doesn't block the event loop during the request."""
+    p = get_provider(api_key=api_key, on_usage=on_usage, provider=provider)
+    return await p.achat_with_tools(messages, tools, phase=phase)
+
+
+async def astream_chat(
+    prompt: str,
+    api_key: str | None = None,
+    on_usage: Callable[[int, int], None] | None = None,
+    phase: str | None = None,
+    provider: str | None = None
+) -> AsyncIterator[str]:
+    """Streaming version of achat(); yields text deltas as the model produces them."""
+    p = get_provider(api_key=api_key, on_usage=on_usage, provider=provider)
+    async for delta in p.astream_chat(prompt, phase=phase):
+        yield delta
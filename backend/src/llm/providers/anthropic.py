@@ -1,6 +1,7 @@
-from anthropic import Anthropic
+import asyncio
+from anthropic import Anthropic, AsyncAnthropic
 from .base import LLMProvider
-from typing import Callable
+from typing import AsyncIterator, Callable
 
 # Phase-based model selection for token optimization
 # - Haiku: Fast and cheap for exploration/understanding
@@ -20,8 +21,20 @@ class AnthropicProvider(LLMProvider):
             self.client = Anthropic(api_key=api_key)
         else:
             self.client = Anthropic()
+        self._api_key = api_key
+        self._async_client: AsyncAnthropic | None = None
         self._on_usage = on_usage  # Callback for token usage tracking
     
+    @property
+    def async_client(self) -> AsyncAnthropic:
+        """Lazily create the async client (only the agent's async path needs it)."""
+        if self._async_client is None:
+            if self._api_key:
+                self._async_client = AsyncAnthropic(api_key=self._api_key)
+            else:
+                self._async_client = AsyncAnthropic()
+        return self._async_client
+    
     def _report_usage(self, response):
         """Report token usage if callback is set."""
         if self._on_usage and hasattr(response, 'usage'):
@@ -29,6 +42,15 @@ class AnthropicProvider(LLMProvider):
             output_tokens = response.usage.output_tokens
             self._on_usage(input_tokens, output_tokens)
     
+    async def _areport_usage(self, response):
+        """Report token usage from a worker thread.
+        
+        The callback may write to the database, which would otherwise block
+        the event loop the async methods run on.
+        """
+        if self._on_usage:
+            await asyncio.to_thread(self._report_usage, response)
+    
     def _get_model(self, phase: str | None = None) -> str:
         """Get the appropriate model for the given phase."""
         if phase and phase in PHASE_MODELS:
@@ -62,4 +84,39 @@ class AnthropicProvider(LLMProvider):
             tools=tools
         )
         self._report_usage(response)
-        return response
\ No newline at end of file
+        return response
+
+    async def achat(self, prompt: str, phase: str | None = None) -> str:
+        model = self._get_model(phase)
+        message = await self.async_client.messages.create(
+            model=model,
+            max_tokens=4096,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        await self._areport_usage(message)
+        return message.content[0].text
+
+    async def achat_with_tools(self, messages: list, tools: list, phase: str | None = None) -> dict:
+        """Async version of chat_with_tools()."""
+        model = self._get_model(phase)
+        response = await self.async_client.messages.create(
+            model=model,
+            max_tokens=4096,
+            messages=messages,
+            tools=tools
+        )
+        await self._areport_usage(response)
+        return response
+
+    async def astream_chat(self, prompt: str, phase: str | None = None) -> AsyncIterator[str]:
+        """Async version of chat() that yields text deltas as they arrive."""
+        model = self._get_model(phase)
+        async with self.async_client.messages.stream(
+            model=model,
+            max_tokens=4096,
+            messages=[{"role": "user", "content": prompt}]
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+        await self._areport_usage(message)
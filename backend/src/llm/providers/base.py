@@ -1,4 +1,6 @@
+import asyncio
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
 
 class LLMProvider(ABC):
     @abstractmethod
@@ -20,4 +22,23 @@ class LLMProvider(ABC):
             tools: Tool schemas
             phase: Optional phase hint for model selection
         """
-        pass
\ No newline at end of file
+        pass
+
+    async def achat(self, prompt: str, phase: str | None = None) -> str:
+        """Async version of chat().
+        
+        Providers with an async SDK client should override this; the default
+        runs the blocking call in a worker thread.
+        """
+        return await asyncio.to_thread(self.chat, prompt, phase)
+
+    async def achat_with_tools(self, messages: list, tools: list, phase: str | None = None) -> dict:
+        """Async version of chat_with_tools(). See achat()."""
+        return await asyncio.to_thread(self.chat_with_tools, messages, tools, phase)
+
+    async def astream_chat(self, prompt: str, phase: str | None = None) -> AsyncIterator[str]:
+        """Stream the response to a prompt as text deltas.
+        
+        The default yields the whole achat() response as a single delta.
+        """
+        yield await self.achat(prompt, phase)
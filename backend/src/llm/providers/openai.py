@@ -1,6 +1,8 @@
-from openai import OpenAI
+import asyncio
+from openai import OpenAI, AsyncOpenAI
 from .base import LLMProvider
-from typing import Callable
+from ...utils import json_compat
+from typing import AsyncIterator, Callable
 
 # Phase-based model selection for OpenAI
 PHASE_MODELS = {
@@ -34,11 +36,10 @@ class _AnthropicCompatResponse:
 
         if message.tool_calls:
             for tc in message.tool_calls:
-                import json
                 self.content.append(_ToolUseBlock(
                     id=tc.id,
                     name=tc.function.name,
-                    input=json.loads(tc.function.arguments),
+                    input=json_compat.loads(tc.function.arguments),
                 ))
 
 
@@ -58,8 +59,22 @@ class _ToolUseBlock:
         self.input = input
 
 
+# Converted schemas keyed by id() of the source list. The tool registry hands
+# out the same list objects on every call, so each is converted only once.
+_MAX_CACHED_TOOLSETS = 8
+_openai_tools_cache: dict[int, tuple[list, list]] = {}
+
+
 def _convert_tools_to_openai(anthropic_tools: list) -> list:
-    """Convert Anthropic tool schemas to OpenAI function-calling format."""
+    """Convert Anthropic tool schemas to OpenAI function-calling format.
+    
+    The result may be shared between calls and must not be mutated.
+    """
+    cached = _openai_tools_cache.get(id(anthropic_tools))
+    # Compare identity too, in case the id was reused by a new list
+    if cached is not None and cached[0] is anthropic_tools:
+        return cached[1]
+    
     openai_tools = []
     for tool in anthropic_tools:
         openai_tools.append({
@@ -70,6 +85,9 @@ def _convert_tools_to_openai(anthropic_tools: list) -> list:
                 "parameters": tool.get("input_schema", {}),
             },
         })
+    
+    if len(_openai_tools_cache) < _MAX_CACHED_TOOLSETS:
+        _openai_tools_cache[id(anthropic_tools)] = (anthropic_tools, openai_tools)
     return openai_tools
 
 
@@ -143,8 +161,20 @@ class OpenAIProvider(LLMProvider):
             self.client = OpenAI(api_key=api_key)
         else:
             self.client = OpenAI()
+        self._api_key = api_key
+        self._async_client: AsyncOpenAI | None = None
         self._on_usage = on_usage
 
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Lazily create the async client (only the agent's async path needs it)."""
+        if self._async_client is None:
+            if self._api_key:
+                self._async_client = AsyncOpenAI(api_key=self._api_key)
+            else:
+                self._async_client = AsyncOpenAI()
+        return self._async_client
+
     def _get_model(self, phase: str | None = None) -> str:
         if phase and phase in PHASE_MODELS:
             return PHASE_MODELS[phase]
@@ -157,6 +187,15 @@ class OpenAIProvider(LLMProvider):
             output_tokens = response.usage.completion_tokens
             self._on_usage(input_tokens, output_tokens)
 
+    async def _areport_usage(self, response):
+        """Report token usage from a worker thread.
+
+        The callback may write to the database, which would otherwise block
+        the event loop the async methods run on.
+        """
+        if self._on_usage:
+            await asyncio.to_thread(self._report_usage, response)
+
     def chat(self, prompt: str, phase: str | None = None) -> str:
         model = self._get_model(phase)
         response = self.client.chat.completions.create(
@@ -185,4 +224,46 @@ class OpenAIProvider(LLMProvider):
             tools=openai_tools if openai_tools else None,
         )
         self._report_usage(response)
-        return _AnthropicCompatResponse(response)
\ No newline at end of file
+        return _AnthropicCompatResponse(response)
+
+    async def achat(self, prompt: str, phase: str | None = None) -> str:
+        model = self._get_model(phase)
+        response = await self.async_client.chat.completions.create(
+            model=model,
+            max_tokens=4096,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        await self._areport_usage(response)
+        return response.choices[0].message.content
+
+    async def achat_with_tools(self, messages: list, tools: list, phase: str | None = None):
+        """Async version of chat_with_tools()."""
+        model = self._get_model(phase)
+        openai_tools = _convert_tools_to_openai(tools)
+        openai_messages = _convert_messages_to_openai(messages)
+
+        response = await self.async_client.chat.completions.create(
+            model=model,
+            max_tokens=4096,
+            messages=openai_messages,
+            tools=openai_tools if openai_tools else None,
+        )
+        await self._areport_usage(response)
+        return _AnthropicCompatResponse(response)
+
+    async def astream_chat(self, prompt: str, phase: str | None = None) -> AsyncIterator[str]:
+        """Async version of chat() that yields text deltas as they arrive."""
+        model = self._get_model(phase)
+        stream = await self.async_client.chat.completions.create(
+            model=model,
+            max_tokens=4096,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            # The final chunk carries usage and no choices
+            if chunk.usage:
+                await self._areport_usage(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
@@ -1,15 +1,17 @@
+from contextvars import ContextVar
 from pathlib import Path
 from typing import TYPE_CHECKING
+from ..utils import speculative_cache
 
 if TYPE_CHECKING:
     from ..agent.change_manager import ChangeManager
 
 
-# Global change manager reference (set by orchestrator)
-_change_manager: "ChangeManager | None" = None
-
-# Global working directory (set by orchestrator when working on a repo)
-_working_dir: Path = Path(".")
+# Change manager and working directory of the run in progress. Context
+# variables, so concurrent runs on one event loop each see their own; the
+# values carry over into tasks and worker threads started by the run.
+_change_manager: ContextVar["ChangeManager | None"] = ContextVar("change_manager", default=None)
+_working_dir: ContextVar[Path] = ContextVar("working_dir", default=Path("."))
 
 # Token optimization: truncation limits
 MAX_FILE_LINES = 200
@@ -17,28 +19,26 @@ MAX_LINE_LENGTH = 500
 
 
 def set_change_manager(manager: "ChangeManager | None") -> None:
-    """Set the global change manager for staging writes."""
-    global _change_manager
-    _change_manager = manager
+    """Set the change manager for staging writes in the current context."""
+    _change_manager.set(manager)
 
 
 def set_working_dir(path: Path | str | None) -> None:
-    """Set the global working directory for file operations.
+    """Set the working directory for file operations in the current context.
     
     Args:
         path: Path to use as root for all file operations.
               None or "." resets to current directory.
     """
-    global _working_dir
     if path is None or str(path) == ".":
-        _working_dir = Path(".")
+        _working_dir.set(Path("."))
     else:
-        _working_dir = Path(path)
+        _working_dir.set(Path(path))
 
 
 def get_working_dir() -> Path:
     """Get the current working directory for file operations."""
-    return _working_dir
+    return _working_dir.get()
 
 
 def _resolve_path(path: str) -> Path:
@@ -47,12 +47,14 @@ def _resolve_path(path: str) -> Path:
     Prevents path traversal attacks by ensuring the resolved path
     stays within the working directory.
     """
+    working_dir = _working_dir.get()
+    
     # Convert to Path and resolve relative to working dir
-    resolved = (_working_dir / path).resolve()
+    resolved = (working_dir / path).resolve()
     
     # Ensure path stays within working directory
     try:
-        resolved.relative_to(_working_dir.resolve())
+        resolved.relative_to(working_dir.resolve())
     except ValueError:
         raise ValueError(f"Path '{path}' would escape the working directory")
     
@@ -86,19 +88,19 @@ def _truncate_content(content: str) -> str:
 def read_file(path: str, change_manager: "ChangeManager | None" = None) -> str:
     """Read and return contents of a file.
     
-    If change_manager is provided (or global _change_manager is set),
+    If change_manager is provided (or one is set for the current run),
     check for staged changes first and return staged content if available.
     
     Large files are automatically truncated to save tokens.
     """
-    # Use provided change_manager or fall back to global
-    manager = change_manager or _change_manager
+    # Use provided change_manager or fall back to the current run's
+    manager = change_manager or _change_manager.get()
     
     # Check for staged changes first
     if manager is not None:
-        for change in manager.get_staged_changes():
-            if change.path == path:
-                return change.new_content
+        change = manager.get_staged_change(path)
+        if change is not None:
+            return change.new_content
     
     # No staged change, read from disk
     try:
@@ -106,24 +108,40 @@ def read_file(path: str, change_manager: "ChangeManager | None" = None) -> str:
     except ValueError as e:
         return f"Error: {e}"
     
-    if not file_path.exists():
-        return f"Error: File '{path}' not found."
-    
-    if not file_path.is_file():
-        return f"Error: '{path}' is not a file."
-    
-    content = file_path.read_text()
+    # Prefetched during planning and unchanged since
+    content = speculative_cache.get(file_path)
+    if content is None:
+        if not file_path.exists():
+            return f"Error: File '{path}' not found."
+        
+        if not file_path.is_file():
+            return f"Error: '{path}' is not a file."
+        
+        content = file_path.read_text()
     return _truncate_content(content)
 
 
+def prefetch_files(paths: list[str]) -> None:
+    """Read files ahead of time so later read_file calls are served from memory.
+    
+    Paths outside the working directory are ignored.
+    """
+    for path in paths:
+        try:
+            file_path = _resolve_path(path)
+        except ValueError:
+            continue
+        speculative_cache.prefetch(file_path)
+
+
 def write_file(path: str, content: str, change_manager: "ChangeManager | None" = None) -> str:
     """Write content to a file. Returns success message.
     
-    If change_manager is provided (or global _change_manager is set), 
+    If change_manager is provided (or one is set for the current run), 
     stage the change instead of writing directly.
     """
-    # Use provided change_manager or fall back to global
-    manager = change_manager or _change_manager
+    # Use provided change_manager or fall back to the current run's
+    manager = change_manager or _change_manager.get()
     
     try:
         file_path = _resolve_path(path)
@@ -145,11 +163,11 @@ def write_file(path: str, content: str, change_manager: "ChangeManager | None" =
 def delete_file(path: str, change_manager: "ChangeManager | None" = None) -> str:
     """Delete a file. Returns success message.
     
-    If change_manager is provided (or global _change_manager is set), 
+    If change_manager is provided (or one is set for the current run), 
     stage the deletion instead of deleting directly.
     """
-    # Use provided change_manager or fall back to global
-    manager = change_manager or _change_manager
+    # Use provided change_manager or fall back to the current run's
+    manager = change_manager or _change_manager.get()
     
     try:
         file_path = _resolve_path(path)
@@ -237,7 +255,7 @@ def search_code(query: str, file_pattern: str = "*") -> str:
             pass  # Skip files that can't be read
     
     # Search recursively from working directory
-    root = _working_dir.resolve()
+    root = _working_dir.get().resolve()
     
     for file_path in root.rglob(file_pattern):
         if len(results) >= max_results:
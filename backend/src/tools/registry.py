@@ -1,9 +1,10 @@
 from .file_ops import read_file, write_file, delete_file, list_directory, search_code
 from .terminal import run_command
 from .indexer_tools import index_symbols, find_symbol
+from types import MappingProxyType
 
-# Map tool names to their implementations
-TOOLS = {
+# Map tool names to their implementations (read-only view; fixed at import)
+TOOLS = MappingProxyType({
     "read_file": read_file,
     "write_file": write_file,
     "delete_file": delete_file,
@@ -12,11 +13,15 @@ TOOLS = {
     "run_command": run_command,
     "index_symbols": index_symbols,
     "find_symbol": find_symbol,
-}
+})
 
 # Tools that are read-only (safe during understanding phase)
 READ_ONLY_TOOLS = {"read_file", "list_directory", "search_code", "run_command", "index_symbols", "find_symbol"}
 
+# Tools that must not run concurrently with other calls in the same turn
+# (they mutate files/staged changes or run arbitrary shell commands)
+SERIAL_TOOLS = {"write_file", "delete_file", "run_command"}
+
 # Tool schemas in Anthropic's format
 TOOL_SCHEMAS = [
     {
@@ -115,19 +120,26 @@ TOOL_SCHEMAS = [
 ]
 
 
+# Schemas are static, so the read-only subset is built once at import
+READ_ONLY_TOOL_SCHEMAS = [t for t in TOOL_SCHEMAS if t["name"] in READ_ONLY_TOOLS]
+
+
 def get_tool_schemas(readonly: bool = False) -> list[dict]:
     """Return tool definitions in Anthropic's tool format.
     
+    The returned list is shared between calls and must not be mutated.
+    
     Args:
         readonly: If True, only return read-only tools (no write_file)
     """
     if readonly:
-        return [t for t in TOOL_SCHEMAS if t["name"] in READ_ONLY_TOOLS]
+        return READ_ONLY_TOOL_SCHEMAS
     return TOOL_SCHEMAS
 
 
 def execute_tool(name: str, **kwargs) -> str:
     """Execute a tool by name with given arguments."""
-    if name not in TOOLS:
+    tool_fn = TOOLS.get(name)
+    if tool_fn is None:
         return f"Error: Unknown tool '{name}'"
-    return TOOLS[name](**kwargs)
\ No newline at end of file
+    return tool_fn(**kwargs)
\ No newline at end of file
@@ -3,9 +3,18 @@ Encryption utilities for sensitive data at rest.
 Uses Fernet symmetric encryption (AES-128-CBC with HMAC).
 """
 import os
+from functools import lru_cache
 from cryptography.fernet import Fernet, InvalidToken
 
 
+@lru_cache(maxsize=1)
+def _fernet_for_key(key: str) -> Fernet:
+    # Built once per key rather than decoding and validating it on every call
+    try:
+        return Fernet(key.encode())
+    except Exception as e:
+        raise ValueError(f"ENCRYPTION_KEY is invalid: {e}")
+
 def _get_fernet() -> Fernet:
     """Get Fernet instance with key from environment."""
     key = os.getenv("ENCRYPTION_KEY")
@@ -14,10 +23,7 @@ def _get_fernet() -> Fernet:
             "ENCRYPTION_KEY environment variable is not set. "
             "This is required to encrypt/decrypt API keys."
         )
-    try:
-        return Fernet(key.encode())
-    except Exception as e:
-        raise ValueError(f"ENCRYPTION_KEY is invalid: {e}")
+    return _fernet_for_key(key)
 
 def encrypt(plain_text: str) -> str:
     """
@@ -43,40 +43,42 @@ class PRResult:
     branch_name: str
 
 
+# Shared by every GitHubClient, so PR creations reuse pooled keep-alive
+# connections to the API instead of a new TCP+TLS handshake each time. The
+# user's token is sent per request.
+http_client = httpx.AsyncClient(
+    base_url="https://api.github.com",
+    headers={
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    },
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    timeout=30.0,
+)
+
+
+async def close_http_client() -> None:
+    """Close the shared GitHub API client (called on app shutdown)."""
+    await http_client.aclose()
+
+
 class GitHubClient:
     """Client for GitHub API operations."""
     
-    BASE_URL = "https://api.github.com"
-    
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, client: Optional[httpx.AsyncClient] = None):
         """
         Initialize GitHub client with user's access token.
         
         Args:
             access_token: GitHub OAuth access token
+            client: HTTP client to send requests with (default: the shared one)
         """
         self.token = access_token
-        self._client: Optional[httpx.Client] = None
-    
-    @property
-    def client(self) -> httpx.Client:
-        """Lazy initialization of HTTP client."""
-        if self._client is None:
-            self._client = httpx.Client(
-                base_url=self.BASE_URL,
-                headers={
-                    "Authorization": f"Bearer {self.token}",
-                    "Accept": "application/vnd.github+json",
-                    "X-GitHub-Api-Version": "2022-11-28",
-                },
-                timeout=30.0,
-            )
-        return self._client
+        self.client = client or http_client
+        self._auth = {"Authorization": f"Bearer {access_token}"}
     
-    def __del__(self):
-        """Clean up HTTP client."""
-        if self._client:
-            self._client.close()
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self.client.request(method, url, headers=self._auth, **kwargs)
     
     def _handle_response(self, response: httpx.Response, action: str) -> dict:
         """Handle API response and raise appropriate errors."""
@@ -162,19 +164,19 @@ class GitHubClient:
         # Default: include raw message for debugging
         return f"Failed to {action}: {raw_message}"
     
-    def get_default_branch(self, owner: str, repo: str) -> str:
+    async def get_default_branch(self, owner: str, repo: str) -> str:
         """Get the default branch of a repository."""
-        response = self.client.get(f"/repos/{owner}/{repo}")
+        response = await self._request("GET", f"/repos/{owner}/{repo}")
         data = self._handle_response(response, "get repository info")
         return data.get("default_branch", "main")
     
-    def get_branch_sha(self, owner: str, repo: str, branch: str) -> str:
+    async def get_branch_sha(self, owner: str, repo: str, branch: str) -> str:
         """Get the SHA of a branch's latest commit."""
-        response = self.client.get(f"/repos/{owner}/{repo}/git/refs/heads/{branch}")
+        response = await self._request("GET", f"/repos/{owner}/{repo}/git/refs/heads/{branch}")
         data = self._handle_response(response, f"get branch '{branch}'")
         return data["object"]["sha"]
     
-    def create_branch(
+    async def create_branch(
         self,
         owner: str,
         repo: str,
@@ -194,10 +196,11 @@ class GitHubClient:
             True if branch was created successfully
         """
         # Get SHA of the base branch
-        base_sha = self.get_branch_sha(owner, repo, from_branch)
+        base_sha = await self.get_branch_sha(owner, repo, from_branch)
         
         # Create the new branch
-        response = self.client.post(
+        response = await self._request(
+            "POST",
             f"/repos/{owner}/{repo}/git/refs",
             json={
                 "ref": f"refs/heads/{branch_name}",
@@ -207,10 +210,11 @@ class GitHubClient:
         self._handle_response(response, f"create branch '{branch_name}'")
         return True
     
-    def get_file_sha(self, owner: str, repo: str, path: str, branch: str) -> Optional[str]:
+    async def get_file_sha(self, owner: str, repo: str, path: str, branch: str) -> Optional[str]:
         """Get the SHA of an existing file (needed for updates)."""
         try:
-            response = self.client.get(
+            response = await self._request(
+                "GET",
                 f"/repos/{owner}/{repo}/contents/{path}",
                 params={"ref": branch}
             )
@@ -221,7 +225,7 @@ class GitHubClient:
         except GitHubError:
             return None
     
-    def commit_file(
+    async def commit_file(
         self,
         owner: str,
         repo: str,
@@ -258,14 +262,15 @@ class GitHubClient:
         if file_sha:
             payload["sha"] = file_sha
         
-        response = self.client.put(
+        response = await self._request(
+            "PUT",
             f"/repos/{owner}/{repo}/contents/{path}",
             json=payload
         )
         data = self._handle_response(response, f"commit file '{path}'")
         return data["commit"]["sha"]
     
-    def delete_file(
+    async def delete_file(
         self,
         owner: str,
         repo: str,
@@ -288,7 +293,8 @@ class GitHubClient:
         Returns:
             Commit SHA
         """
-        response = self.client.delete(
+        response = await self._request(
+            "DELETE",
             f"/repos/{owner}/{repo}/contents/{path}",
             json={
                 "message": message,
@@ -299,7 +305,7 @@ class GitHubClient:
         data = self._handle_response(response, f"delete file '{path}'")
         return data["commit"]["sha"]
     
-    def commit_changes(
+    async def commit_changes(
         self,
         owner: str,
         repo: str,
@@ -333,7 +339,7 @@ class GitHubClient:
             content = change.get("newContent", "")
             
             # Get existing file SHA if needed
-            file_sha = self.get_file_sha(owner, repo, path, branch)
+            file_sha = await self.get_file_sha(owner, repo, path, branch)
             
             # Generate individual commit message
             action = {"create": "Add", "modify": "Update", "delete": "Delete"}.get(change_type, "Update")
@@ -343,9 +349,9 @@ class GitHubClient:
                 if not file_sha:
                     print(f"Warning: File '{path}' doesn't exist, skipping delete")
                     continue
-                sha = self.delete_file(owner, repo, branch, path, file_message, file_sha)
+                sha = await self.delete_file(owner, repo, branch, path, file_message, file_sha)
             else:
-                sha = self.commit_file(
+                sha = await self.commit_file(
                     owner, repo, branch, path, content, file_message, file_sha
                 )
             
@@ -353,7 +359,7 @@ class GitHubClient:
         
         return commit_shas
     
-    def create_pull_request(
+    async def create_pull_request(
         self,
         owner: str,
         repo: str,
@@ -376,7 +382,8 @@ class GitHubClient:
         Returns:
             PRResult with URL and details
         """
-        response = self.client.post(
+        response = await self._request(
+            "POST",
             f"/repos/{owner}/{repo}/pulls",
             json={
                 "title": title,
@@ -412,13 +419,14 @@ def generate_branch_name(task_summary: str) -> str:
     return f"koda/{sanitized}-{timestamp}"
 
 
-def create_pr_for_changes(
+async def create_pr_for_changes(
     access_token: str,
     owner: str,
     repo: str,
     changes: list[dict],
     task_description: str,
-    base_branch: str = "main"
+    base_branch: str = "main",
+    client: Optional[httpx.AsyncClient] = None
 ) -> PRResult:
     """
     High-level function to create a PR with all changes.
@@ -430,21 +438,22 @@ def create_pr_for_changes(
         changes: List of file changes
         task_description: Original task description (used for PR body)
         base_branch: Target branch
+        client: HTTP client to send requests with (default: the shared one)
         
     Returns:
         PRResult with PR URL and details
     """
-    client = GitHubClient(access_token)
+    github = GitHubClient(access_token, client)
     
     # Generate branch name
     branch_name = generate_branch_name(task_description)
     
     # Create branch from base
-    client.create_branch(owner, repo, branch_name, base_branch)
+    await github.create_branch(owner, repo, branch_name, base_branch)
     
     # Commit all changes
     commit_message = f"feat: {task_description[:50]}"
-    client.commit_changes(owner, repo, branch_name, changes, commit_message)
+    await github.commit_changes(owner, repo, branch_name, changes, commit_message)
     
     # Create PR
     pr_title = f"🤖 Koda: {task_description[:80]}"
@@ -461,7 +470,7 @@ def create_pr_for_changes(
 *This PR was created automatically by [Koda](https://github.com/your-org/koda), an AI coding agent.*
 """
     
-    return client.create_pull_request(
+    return await github.create_pull_request(
         owner, repo, pr_title, pr_body, branch_name, base_branch
     )
 
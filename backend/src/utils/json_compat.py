@@ -0,0 +1,26 @@
+"""JSON helpers that use orjson when it is installed.
+
+orjson parses and serializes several times faster than the stdlib and its
+JSONDecodeError subclasses json.JSONDecodeError, so callers can catch
+either. Falls back to the stdlib json module when orjson is missing.
+"""
+try:
+    import orjson
+
+    loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def dumps(obj) -> str:
+        """Serialize to compact JSON text (non-ASCII left unescaped)."""
+        return orjson.dumps(obj).decode()
+except ImportError:
+    import json
+
+    loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+    def dumps(obj) -> str:
+        """Serialize to compact JSON text (non-ASCII left unescaped)."""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+__all__ = ["loads", "dumps", "JSONDecodeError"]
@@ -1,73 +1,132 @@
 """Repository summary cache for token optimization.
 
 Caches codebase summaries to avoid re-exploring unchanged repos.
-Cache key is based on repo path + latest commit hash.
+Cache key is based on repo content (HEAD commit + uncommitted changes), so
+checkouts with identical content share an entry. Recent entries are also
+kept in memory in front of the on-disk store.
 """
+import asyncio
+import concurrent.futures
 import json
 import hashlib
+import os
 import subprocess
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
+from typing import Awaitable, Callable
 
 CACHE_DIR = Path.home() / ".koda" / "cache"
 
+# Summaries older than this are re-explored even if the repo is unchanged
+CACHE_TTL_SECONDS = 24 * 60 * 60
 
-def get_cache_key(repo_path: str) -> str:
-    """Generate cache key from repo path + latest commit hash."""
-    # Get latest commit hash
+# In-process LRU of cache key -> (summary, created_at)
+MEMORY_CACHE_SIZE = 32
+_memory_cache: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+# Summaries currently being computed, by cache key. Server agents share one
+# event loop, but the CLI runs each agent under its own asyncio.run(), so
+# these are thread-safe futures that any loop can wait on.
+_inflight: dict[str, concurrent.futures.Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _git(repo_path: str, *args: str) -> str | None:
+    """Run a git command in the repo and return stdout, or None on failure."""
     try:
         result = subprocess.run(
-            ["git", "rev-parse", "HEAD"],
+            ["git", *args],
             cwd=repo_path,
             capture_output=True,
             text=True,
             timeout=5
         )
-        commit = result.stdout.strip() if result.returncode == 0 else "unknown"
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        commit = "unknown"
-    
-    # Create unique key from path + commit
-    key_str = f"{repo_path}:{commit}"
-    return hashlib.md5(key_str.encode()).hexdigest()
+    except (subprocess.TimeoutExpired, FileNotFoundError, NotADirectoryError):
+        return None
+    return result.stdout if result.returncode == 0 else None
 
 
-def get_cached_summary(repo_path: str) -> str | None:
-    """Return cached summary if it exists and is valid.
+def _repo_fingerprint(repo_path: str) -> str:
+    """Identify the repo's content: HEAD commit + digest of uncommitted changes.
     
-    Args:
-        repo_path: Path to the repository
-        
-    Returns:
-        Cached summary string, or None if no cache exists
+    The digest covers the diff against HEAD and each untracked file's path,
+    size and mtime, so editing an already modified file changes it too.
+    Falls back to the path for directories that aren't git repos.
     """
+    commit = _git(repo_path, "rev-parse", "HEAD")
+    if commit is None:
+        return f"{repo_path}:unknown"
+    digest = hashlib.sha256()
+    digest.update((_git(repo_path, "diff", "HEAD") or "").encode())
+    untracked = _git(repo_path, "ls-files", "--others", "--exclude-standard", "-z") or ""
+    for path in untracked.split("\0"):
+        if not path:
+            continue
+        try:
+            stat = os.stat(os.path.join(repo_path, path))
+        except OSError:
+            continue
+        digest.update(f"\0{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return f"{commit.strip()}:{digest.hexdigest()}"
+
+
+def get_cache_key(repo_path: str) -> str:
+    """Generate cache key from the repo's content fingerprint."""
+    fingerprint = _repo_fingerprint(repo_path)
+    return hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+
+
+def _remember(key: str, summary: str, created_at: float) -> None:
+    """Store an entry in the in-process LRU, evicting the oldest if full."""
+    _memory_cache[key] = (summary, created_at)
+    _memory_cache.move_to_end(key)
+    if len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+def _load_summary(key: str) -> str | None:
+    """Look up a summary by cache key, checking memory before disk."""
+    now = time.time()
+    
+    entry = _memory_cache.get(key)
+    if entry is not None:
+        summary, created_at = entry
+        if now - created_at < CACHE_TTL_SECONDS:
+            _memory_cache.move_to_end(key)
+            return summary
+        del _memory_cache[key]
+    
     try:
-        key = get_cache_key(repo_path)
         cache_file = CACHE_DIR / f"{key}.json"
         
         if cache_file.exists():
             data = json.loads(cache_file.read_text())
-            return data.get("summary")
+            summary = data.get("summary")
+            created_at = data.get("created_at", 0)
+            if summary and now - created_at < CACHE_TTL_SECONDS:
+                _remember(key, summary, created_at)
+                return summary
     except (json.JSONDecodeError, OSError):
         pass
     
     return None
 
 
-def save_summary(repo_path: str, summary: str) -> None:
-    """Cache the repository summary.
+def _store_summary(key: str, repo_path: str, summary: str) -> None:
+    """Save a summary under a cache key, in memory and on disk."""
+    created_at = time.time()
+    _remember(key, summary, created_at)
     
-    Args:
-        repo_path: Path to the repository
-        summary: Summary text to cache
-    """
     try:
         CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        key = get_cache_key(repo_path)
         cache_file = CACHE_DIR / f"{key}.json"
         
         cache_data = {
             "summary": summary,
             "repo_path": repo_path,
+            "created_at": created_at,
         }
         cache_file.write_text(json.dumps(cache_data, indent=2))
     except OSError:
@@ -75,6 +134,74 @@ def save_summary(repo_path: str, summary: str) -> None:
         pass
 
 
+def get_cached_summary(repo_path: str) -> str | None:
+    """Return cached summary if it exists and is valid.
+    
+    Args:
+        repo_path: Path to the repository
+        
+    Returns:
+        Cached summary string, or None if no cache exists or it has expired
+    """
+    return _load_summary(get_cache_key(repo_path))
+
+
+def save_summary(repo_path: str, summary: str) -> None:
+    """Cache the repository summary.
+    
+    Args:
+        repo_path: Path to the repository
+        summary: Summary text to cache
+    """
+    _store_summary(get_cache_key(repo_path), repo_path, summary)
+
+
+async def get_or_compute_summary(
+    repo_path: str,
+    compute: Callable[[], Awaitable[str]],
+) -> tuple[str, bool]:
+    """Return the cached summary, or compute and cache it.
+    
+    Concurrent callers for the same repo content share one computation: the
+    first caller runs compute() and the rest wait for its result. If that
+    computation fails, waiters fall back to computing it themselves.
+    
+    Args:
+        repo_path: Path to the repository
+        compute: Coroutine function that explores the repo and returns a summary
+        
+    Returns:
+        (summary, cached) where cached is False if this caller computed it
+    """
+    key = await asyncio.to_thread(get_cache_key, repo_path)
+    summary = await asyncio.to_thread(_load_summary, key)
+    if summary is not None:
+        return summary, True
+    
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = concurrent.futures.Future()
+    
+    if not owner:
+        # shield() so a cancelled waiter doesn't cancel the shared future
+        summary = await asyncio.shield(asyncio.wrap_future(future))
+        if summary is not None:
+            return summary, True
+        return await compute(), False
+    
+    summary = None
+    try:
+        summary = await compute()
+        await asyncio.to_thread(_store_summary, key, repo_path, summary)
+        return summary, False
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        future.set_result(summary)
+
+
 def clear_cache(repo_path: str | None = None) -> int:
     """Clear cached summaries.
     
@@ -85,6 +212,11 @@ def clear_cache(repo_path: str | None = None) -> int:
     Returns:
         Number of cache files removed
     """
+    if repo_path:
+        _memory_cache.pop(get_cache_key(repo_path), None)
+    else:
+        _memory_cache.clear()
+    
     if not CACHE_DIR.exists():
         return 0
     
@@ -0,0 +1,70 @@
+"""Speculative file-read cache.
+
+While the plan is being generated, files mentioned in the codebase summary
+are read ahead of time so that read_file calls during execution find them
+already loaded. Entries are validated against the file's mtime and size, so
+a file changed after it was prefetched is read again from disk.
+"""
+import os
+import re
+from pathlib import Path
+
+# Relative file paths with a known source/config extension
+_FILE_PATH_RE = re.compile(
+    r"(?<![\w/.-])((?:[\w.-]+/)*[\w.-]+\.(?:py|pyi|js|jsx|ts|tsx|json|md|toml|yaml|yml|txt|cfg|ini|html|css|sh|go|rs|java|rb))\b"
+)
+
+# Limits on what a single summary can prefetch
+MAX_PREFETCH_FILES = 20
+MAX_PREFETCH_BYTES = 256 * 1024
+
+# Oldest entries are evicted beyond this many files
+MAX_CACHED_FILES = 128
+
+# Resolved path -> (mtime_ns, size, content)
+_cache: dict[Path, tuple[int, int, str]] = {}
+
+
+def extract_paths(text: str) -> list[str]:
+    """Return distinct file paths mentioned in text, in order of appearance."""
+    paths = dict.fromkeys(match.group(1) for match in _FILE_PATH_RE.finditer(text))
+    return list(paths)[:MAX_PREFETCH_FILES]
+
+
+def prefetch(file_path: Path) -> None:
+    """Read a file into the cache. Missing, large or unreadable files are skipped."""
+    try:
+        stat = os.stat(file_path)
+        if stat.st_size > MAX_PREFETCH_BYTES or not file_path.is_file():
+            return
+        content = file_path.read_text()
+    except (OSError, UnicodeDecodeError):
+        return
+
+    _cache.pop(file_path, None)
+    _cache[file_path] = (stat.st_mtime_ns, stat.st_size, content)
+    while len(_cache) > MAX_CACHED_FILES:
+        _cache.pop(next(iter(_cache)), None)
+
+
+def get(file_path: Path) -> str | None:
+    """Return the prefetched content of a file if it hasn't changed since."""
+    entry = _cache.get(file_path)
+    if entry is None:
+        return None
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        _cache.pop(file_path, None)
+        return None
+
+    mtime_ns, size, content = entry
+    if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+        _cache.pop(file_path, None)
+        return None
+    return content
+
+
+def clear() -> None:
+    """Drop all prefetched files."""
+    _cache.clear()
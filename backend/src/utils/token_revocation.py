@@ -0,0 +1,121 @@
+"""Revocation list for issued JWTs.
+
+Tokens can be revoked one at a time by their jti (on logout), or all at once
+for a user by recording a cutoff: tokens issued before it are rejected (on
+account deletion). Entries only need to outlive the tokens they cover, so
+they are stored with a TTL.
+
+When REDIS_URL is set and the redis package is installed, the list is shared
+by every server process through Redis. Otherwise it is kept in this process
+only.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+KEY_PREFIX = "koda:revoked:"
+
+_redis = redis.Redis.from_url(REDIS_URL) if redis is not None and REDIS_URL else None
+
+# Key -> (value, expires_at). Written even when Redis is configured, so a
+# revocation always takes effect in the process that made it.
+_local: dict[str, tuple[float, float]] = {}
+_local_lock = threading.Lock()
+# Expired local entries are swept once the table grows past this
+MAX_LOCAL_ENTRIES = 10_000
+
+# Keys Redis recently had no entry for -> time until which that answer is
+# reused. Saves a Redis round trip on every authenticated request, at the
+# cost of a revocation made by another process taking up to this long to
+# apply here (0 disables).
+REMOTE_MISS_TTL = float(os.getenv("REVOCATION_CHECK_TTL", "5"))
+_remote_misses: dict[str, float] = {}
+
+
+def _store(key: str, value: float, ttl: float) -> None:
+    if ttl <= 0:
+        return
+    now = time.time()
+    with _local_lock:
+        _local[key] = (value, now + ttl)
+        if len(_local) > MAX_LOCAL_ENTRIES:
+            for stale in [k for k, (_, expires_at) in _local.items() if expires_at <= now]:
+                del _local[stale]
+
+    if _redis is not None:
+        try:
+            _redis.set(KEY_PREFIX + key, value, ex=max(1, int(ttl + 1)))
+        except redis.RedisError as e:
+            print(f"Warning: Failed to store token revocation in Redis: {e}")
+
+
+def revoke_token(jti: str, expires_at: float) -> None:
+    """Revoke a single token until the time it would have expired anyway."""
+    _store(f"jti:{jti}", 1.0, expires_at - time.time())
+
+
+def revoke_user_tokens(user_id: int, max_token_age: float) -> None:
+    """Revoke every token issued to a user so far.
+
+    max_token_age is the longest a token can stay valid, after which the
+    cutoff no longer needs to be remembered.
+    """
+    _store(f"user:{user_id}", time.time(), max_token_age)
+
+
+def is_revoked(jti: Optional[str], user_id: int, issued_at: Optional[float]) -> bool:
+    """Whether a token (identified by its jti, subject and iat) was revoked.
+
+    Tokens without an iat can't be placed relative to a user cutoff, so any
+    cutoff for their user revokes them.
+    """
+    keys = [f"user:{user_id}"]
+    if jti:
+        keys.append(f"jti:{jti}")
+
+    now = time.time()
+    with _local_lock:
+        values: list[Optional[float]] = []
+        for key in keys:
+            entry = _local.get(key)
+            values.append(entry[0] if entry is not None and entry[1] > now else None)
+        # Keys to look up in Redis: not revoked locally and not recently missed
+        remote_keys = [
+            i for i, key in enumerate(keys)
+            if values[i] is None and _remote_misses.get(key, 0.0) <= now
+        ] if _redis is not None else []
+
+    if remote_keys:
+        try:
+            remote = _redis.mget([KEY_PREFIX + keys[i] for i in remote_keys])
+        except redis.RedisError as e:
+            print(f"Warning: Failed to check token revocation in Redis: {e}")
+        else:
+            with _local_lock:
+                for i, value in zip(remote_keys, remote):
+                    if value is not None:
+                        values[i] = float(value)
+                    elif REMOTE_MISS_TTL > 0:
+                        _remote_misses[keys[i]] = now + REMOTE_MISS_TTL
+                if len(_remote_misses) > MAX_LOCAL_ENTRIES:
+                    for stale in [k for k, until in _remote_misses.items() if until <= now]:
+                        del _remote_misses[stale]
+
+    cutoff = values[0]
+    if cutoff is not None and (issued_at is None or issued_at <= cutoff):
+        return True
+    return jti is not None and values[-1] is not None
+
+
+def clear() -> None:
+    """Drop this process's local revocation entries."""
+    with _local_lock:
+        _local.clear()
+        _remote_misses.clear()
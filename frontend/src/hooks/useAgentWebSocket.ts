@@ -2,6 +2,7 @@ import { useCallback, useRef } from 'react'
 import { useAgentStore } from '../stores/agentStore'
 import { useToast } from './useToast'
 import { useAuth } from '../contexts/AuthContext'
+import type { StagedChange } from '../types/changes'
 
 const WS_BASE_URL = import.meta.env.VITE_WS_URL
 if (!WS_BASE_URL) {
@@ -13,6 +14,10 @@ const MAX_RECONNECT_ATTEMPTS = 3
 const INITIAL_RECONNECT_DELAY = 1000 // 1 second
 const MAX_RECONNECT_DELAY = 10000 // 10 seconds
 
+// Streamed events carry a "seq"; acking every ACK_EVERY of them keeps the
+// server sending (it allows 64 unacked events in flight)
+const ACK_EVERY = 16
+
 export interface RepoInfo {
   url: string
   branch: string
@@ -61,6 +66,9 @@ export function useAgentWebSocket() {
     const ws = new WebSocket(wsUrl)
     currentWs.current = ws
 
+    // Staged changes arrive one 'change' message each, before 'complete'
+    const receivedChanges: StagedChange[] = []
+
     ws.onopen = () => {
       setConnected(true)
       reconnectAttempts.current = 0
@@ -68,7 +76,7 @@ export function useAgentWebSocket() {
       
       // Only send task on initial connection, not reconnection
       if (task) {
-        const message: { task: string; repo_url?: string; branch?: string } = { task }
+        const message: { task: string; ack: boolean; repo_url?: string; branch?: string } = { task, ack: true }
         
         // Include repo info if provided
         if (repo) {
@@ -81,7 +89,11 @@ export function useAgentWebSocket() {
     }
 
     ws.onmessage = (event) => {
-      const { type, data } = JSON.parse(event.data)
+      const { type, data, seq } = JSON.parse(event.data)
+
+      if (typeof seq === 'number' && seq % ACK_EVERY === 0) {
+        ws.send(JSON.stringify({ type: 'ack', seq }))
+      }
 
       switch (type) {
         case 'phase':
@@ -105,9 +117,12 @@ export function useAgentWebSocket() {
             }))
           )
           break
+        case 'change':
+          receivedChanges.push(data)
+          break
         case 'complete':
           setPhase(data.phase)
-          setStagedChanges(data.changes || [])
+          setStagedChanges(data.changes || receivedChanges)
           updateTaskStatus(historyId, data.changes?.length > 0 ? 'complete' : 'complete')
           isIntentionallyClosed.current = true
           ws.close()